@@ -2,10 +2,13 @@ import importlib.metadata
 
 __version__ = importlib.metadata.version("dvg")
 
+from . import string_table
 from . import scdv_embedding
 from . import models
+from . import shared_model
 from . import scanners
 from . import iter_funcs
 from . import text_funcs
 from . import search_result
+from . import search_index
 from . import dvg
@@ -1,9 +1,13 @@
-from typing import Iterable, Iterator, List, Optional
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
+import contextlib
+import copy
+import functools
 from glob import iglob
 import importlib
 import io
-from multiprocessing import Pool
+import math
+from multiprocessing import Array, Pool
 from multiprocessing.shared_memory import SharedMemory
 import os
 import platform
@@ -11,57 +15,72 @@ import sys
 from time import time
 import unicodedata
 
+import appdirs
 from docopt import docopt
 from init_attrs_with_kwargs import InitAttrsWKwArgs
 import numpy as np
 from win_wildcard import expand_windows_wildcard, get_windows_shell
 
 
-from .iter_funcs import chunked_iter, para_chunked_iter, sliding_window_iter
+from .extraction_cache import ExtractionCache
+from .file_walker import walk_document_file_sizes
+from .iter_funcs import (
+    PrefetchStats,
+    chunked_iter,
+    prefetch_map,
+    rolling_window_iter,
+    sliding_window_iter,
+    threaded_iter,
+    weighted_chunked_iter,
+)
+from .line_cache import LineWordIdCache
 from .models import SCDVModel, do_find_model_spec, load_tokenize_func
-from .scanners import Scanner, ScanError, ScanErrorNotFile, to_lines
+from .scanners import Scanner, ScanError, ScanErrorNotFile, pdf_parts_for, read_text_file, to_lines
+from .search_index import (
+    W_BEGIN,
+    W_END,
+    W_FILE,
+    W_PARA_LEN,
+    DocumentIndexData,
+    IndexedFile,
+    SearchIndex,
+    SearchIndexError,
+    SearchIndexWriter,
+    index_document,
+    index_exists,
+    indexed_file_of,
+    is_file_unchanged,
+)
 from .search_result import (
     ANSI_ESCAPE_CLEAR_CUR_LINE,
     SLPLD,
+    Pos,
+    SearchResultRecord,
+    TopKCollector,
     excerpt_text,
-    trim_search_results,
+    print_intermediate_progress,
     print_intermediate_search_result,
+    print_search_result_records,
     prune_overlapped_paragraphs,
 )
-from .text_funcs import includes_all_texts, includes_any_of_texts
+from .server import DEFAULT_SERVER_PORT, ServerError, make_search_server, make_server_token, request_search
+from .server import write_token_file
+from .shared_model import SharedModelHandle, attach_model, close_shared_memories, share_model
+from .text_funcs import TextConditions
 
 
 _script_dir = os.path.dirname(os.path.realpath(__file__))
 
 
-def model_shared(model: SCDVModel):
-    shms = []
-
-    model.tokenizer = None
-
-    emb = model.embedder
-
-    cvs = emb.cluster_idf_wvs
-    shmc = SharedMemory(create=True, size=cvs.nbytes)
-    shms.append(shmc)
-    cvs_shared = np.ndarray(cvs.shape, dtype=cvs.dtype, buffer=shmc.buf)
-    cvs_shared[:] = cvs[:]
-    emb.cluster_idf_wvs = cvs_shared
-
-    return shms
-
-
-def model_shared_close(shms):
-    for shm in shms:
-        shm.close()
-        shm.unlink()
-
-
 VERSION = importlib.metadata.version("dvg")
 DEFAULT_TOP_K = 20
 DEFAULT_WINDOW_SIZE = 20
 DEFAULT_EXCERPT_CHARS = 80
 DEFAULT_PREFER_LONGER_THAN = 80
+DEFAULT_CACHE_SIZE = 1024  # MiB
+DEFAULT_IO_WORKERS = 0
+DEFAULT_LINE_CACHE_SIZE = 64  # MiB
+DEFAULT_COARSE_FACTOR = 0
 
 
 class CLArgs(InitAttrsWKwArgs):
@@ -74,6 +93,7 @@ class CLArgs(InitAttrsWKwArgs):
     top_n: Optional[int]
     paragraph_search: bool
     window: int
+    window_given: bool
     include: List[str]
     exclude: List[str]
     min_length: int
@@ -81,11 +101,24 @@ class CLArgs(InitAttrsWKwArgs):
     quote: bool
     header: bool
     workers: Optional[int]
+    io_workers: int
+    line_cache: int
+    coarse: int
     help: bool
     version: bool
     diagnostic: bool
     unix_wildcard: bool
     vv: bool
+    index_dir: Optional[str]
+    cache: bool
+    cache_dir: Optional[str]
+    cache_size: int
+    no_cache: bool
+    remote: bool
+    port: int
+    queries_file: Optional[str]
+    min_file_size: int
+    max_file_size: Optional[int]
 
 
 __doc__: str = """Document-vector Grep.
@@ -93,6 +126,10 @@ __doc__: str = """Document-vector Grep.
 Usage:
   dvg [options] [-i TEXT]... [-e TEXT]... -m MODEL <query> <file>...
   dvg [options] [-i TEXT]... [-e TEXT]... -m MODEL -f QUERYFILE <file>...
+  dvg [options] [-i TEXT]... [-e TEXT]... -m MODEL --index-dir=INDEXDIR <query>
+  dvg [options] [-i TEXT]... [-e TEXT]... -m MODEL --index-dir=INDEXDIR -f QUERYFILE
+  dvg [options] [-i TEXT]... [-e TEXT]... -m MODEL --queries-file=QUERIESFILE <file>...
+  dvg [options] [-i TEXT]... [-e TEXT]... -m MODEL --index-dir=INDEXDIR --queries-file=QUERIESFILE
   dvg -m MODEL --diagnostic
   dvg --help
   dvg --version
@@ -100,9 +137,9 @@ Usage:
 Options:
   -v, --verbose                 Verbose.
   -m MODEL, --model=MODEL       Model name.
-  -k NUM, --top-k=NUM           Show top NUM files [default: {dtk}].
+  -k NUM, --top-k=NUM           Show top NUM files (0 for all) [default: {dtk}].
   -p, --paragraph-search        Search paragraphs in documents.
-  -w NUM, --window=NUM          Line window size [default: {dws}].
+  -w NUM, --window=NUM          Line window size (default: {dws}, or the one of the index of option --index-dir).
   -f QUERYFILE, --query-file=QUERYFILE  Read query text from the file.
   -i TEXT, --include=TEXT       Requires containing the specified text.
   -e TEXT, --exclude=TEXT       Requires not containing the specified text.
@@ -111,12 +148,100 @@ Options:
   -q, --quote                   Show text instead of excerpt.
   -H, --header                  Print the header line.
   -j WORKERS, --workers=WORKERS         Worker process.
+  --io-workers=NUM              Threads (of each worker process) to read documents ahead of scoring [default: {diw}].
+  --line-cache=MIB              Memory (of each worker process) to cache tokenized lines, 0 to disable [default: {dlc}].
+  --coarse=FACTOR               Score windows FACTOR times as large first, and the windows of the size of option -w
+                                only in the promising ones (approximate), 0 to disable [default: {dcf}].
   --diagnostic                  Check model installation.
   -u, --unix-wildcard           Use Unix-style pattern expansion on Windows.
   --vv                          Show name of each input file (for debug).
   -n NUM, --top-n=NUM           Show top NUM files (same as option -k).
+  --index-dir=INDEXDIR          Search the documents in the index, instead of document files.
+  --queries-file=QUERIESFILE    Read queries from the file, one query per line, and search for all of them at once.
+  --cache                       Cache the text extracted from .pdf, .docx, and .html files.
+  --cache-dir=DIR               Directory of the cache (implies --cache). Also given by env var DVG_CACHE_DIR.
+  --cache-size=MIB              Size limit of the cache [default: {dcs}].
+  --no-cache                    Do not use the cache.
+  --remote                      Search with a server started by `dvg serve`, instead of loading the model.
+  --port=PORT                   Port number of the server [default: {dsp}].
+  --min-file-size=BYTES         Skip smaller files found in directories [default: 0].
+  --max-file-size=BYTES         Skip larger files found in directories.
+
+A directory given as <file> is searched recursively for .txt, .html, .pdf, and .docx files, skipping the ones
+that match the patterns in `.dvgignore` files.
+
+To build an index of documents, run `dvg index --help`. To start a server, run `dvg serve --help`.
+""".format(
+    dtk=DEFAULT_TOP_K,
+    dws=DEFAULT_WINDOW_SIZE,
+    dplt=DEFAULT_PREFER_LONGER_THAN,
+    dec=DEFAULT_EXCERPT_CHARS,
+    dcs=DEFAULT_CACHE_SIZE,
+    diw=DEFAULT_IO_WORKERS,
+    dlc=DEFAULT_LINE_CACHE_SIZE,
+    dcf=DEFAULT_COARSE_FACTOR,
+    dsp=DEFAULT_SERVER_PORT,
+)
+
+
+class IndexCLArgs(InitAttrsWKwArgs):
+    index: bool
+    indexdir: str
+    file: List[str]
+    verbose: bool
+    model: str
+    window: int
+    workers: Optional[int]
+    unix_wildcard: bool
+    update: bool
+    hash: bool
+    min_file_size: int
+    max_file_size: Optional[int]
+    help: bool
+
+
+__doc_index__: str = """Build an index of documents, for searching with `dvg --index-dir=INDEXDIR`.
+
+Usage:
+  dvg index [options] -m MODEL <indexdir> <file>...
+  dvg index --help
+
+Options:
+  -v, --verbose                 Verbose.
+  -m MODEL, --model=MODEL       Model name.
+  -w NUM, --window=NUM          Line window size (default: {dws}, or the one of the index to update).
+  -j WORKERS, --workers=WORKERS         Worker process.
+  -u, --unix-wildcard           Use Unix-style pattern expansion on Windows.
+  --update                      Update the existing index. Only the files added or modified are scanned, and
+                                the files not given in the arguments are removed from the index.
+  --hash                        Record content hashes of files, to detect modification in updates.
+  --min-file-size=BYTES         Skip smaller files found in directories [default: 0].
+  --max-file-size=BYTES         Skip larger files found in directories.
+""".format(
+    dws=DEFAULT_WINDOW_SIZE
+)
+
+
+class ServeCLArgs(InitAttrsWKwArgs):
+    serve: bool
+    verbose: bool
+    model: str
+    port: int
+    help: bool
+
+
+__doc_serve__: str = """Start a search server, which keeps a model loaded and serves searches by `dvg --remote`.
+
+Usage:
+  dvg serve [options] -m MODEL
+  dvg serve --help
+
+Options:
+  -v, --verbose                 Verbose.
+  -m MODEL, --model=MODEL       Model name.
+  --port=PORT                   Port number of localhost [default: {dsp}].
 """.format(
-    dtk=DEFAULT_TOP_K, dws=DEFAULT_WINDOW_SIZE, dplt=DEFAULT_PREFER_LONGER_THAN, dec=DEFAULT_EXCERPT_CHARS
+    dsp=DEFAULT_SERVER_PORT
 )
 
 
@@ -138,183 +263,781 @@ def do_extract_query_lines(query: Optional[str], query_file: Optional[str]) -> L
     return lines
 
 
-def expand_file_iter(target_files: Iterable[str], windows_style: bool = False) -> Iterator[str]:
+def expand_file_iter(
+    target_files: Iterable[str], windows_style: bool = False, min_size: int = 0, max_size: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Expands the wildcards in the file names. A directory is walked recursively for the document files in it,
+    which are filtered by the size range.
+    """
+    for f, _size in expand_file_size_iter(target_files, windows_style, min_size, max_size):
+        yield f
+
+
+def expand_file_size_iter(
+    target_files: Iterable[str], windows_style: bool = False, min_size: int = 0, max_size: Optional[int] = None
+) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Same as `expand_file_iter`, but yields each file with its size, if known (i.e., found by walking a directory).
+    """
     if windows_style and get_windows_shell() is not None:
         for f in target_files:
-            if f == "-":
+            if os.path.isdir(f):
+                yield from walk_document_file_sizes(f, min_size=min_size, max_size=max_size)
+            elif f == "-":
                 for L in sys.stdin:
                     L = L.rstrip()
-                    yield L
+                    yield L, None
             else:
                 for gf in expand_windows_wildcard(f):
                     if os.path.isfile(gf):
-                        yield gf
+                        yield gf, None
     else:
         for f in target_files:
-            if f == "-":
+            if os.path.isdir(f):
+                yield from walk_document_file_sizes(f, min_size=min_size, max_size=max_size)
+            elif f == "-":
                 for L in sys.stdin:
                     L = L.rstrip()
-                    yield L
+                    yield L, None
             elif "*" in f:
                 for gf in iglob(f, recursive=True):
                     if os.path.isfile(gf):
-                        yield gf
+                        yield gf, None
             else:
-                yield f
+                yield f, None
 
 
-def find_similar_paragraphs(doc_files: Iterable[str], model: SCDVModel, a: CLArgs) -> List[SLPLD]:
-    scanner = Scanner()
+# rough costs of extracting text from a file, per byte, relative to a plain text file
+_EXTRACTION_COST_FACTORS = {".html": 2.0, ".pdf": 4.0, ".docx": 8.0}
+_FILE_COST = 4096  # a fixed cost of each file, in bytes of a plain text file
 
-    search_results: List[SLPLD] = []
-    sim_min_req = 0.5
-    for df in doc_files:
+# the max weight (in bytes of plain text files) of a chunk of files for a worker process
+_CHUNK_WEIGHT = 16 * 1024 * 1024
+_SCHEDULING_LOOKAHEAD = 2000
+_CHUNKS_PER_WORKER = 4  # min number of chunks of each lookahead buffer, for each worker process
+
+
+def document_weight(df: str, size: Optional[int] = None) -> float:
+    """
+    Estimates the cost of reading and scoring a document file, from its size (if not given, the size of the file)
+    and type.
+    """
+    if size is None:
+        try:
+            size = os.path.getsize(df)
+        except OSError:
+            size = 0  # an error will be reported by the worker process
+    return _FILE_COST + size * _EXTRACTION_COST_FACTORS.get(os.path.splitext(df)[1].lower(), 1.0)
+
+
+def scheduled_chunked_iter(
+    doc_file_sizes: Iterable[Tuple[str, Optional[int]]], max_chunk_size: int, workers: int
+) -> Iterator[List[str]]:
+    """
+    Groups the document files (with their sizes, if known) into chunks to be dispatched to worker processes.
+    The files read ahead are split into a few chunks for each worker process, and a large file makes a chunk by
+    itself and is dispatched early, so that no worker process is left processing a large file at the end.
+    """
+    chunks = weighted_chunked_iter(
+        doc_file_sizes,
+        lambda fs: document_weight(*fs),
+        _CHUNK_WEIGHT,
+        max_chunk_size,
+        _SCHEDULING_LOOKAHEAD,
+        workers * _CHUNKS_PER_WORKER,
+    )
+    return threaded_iter(([df for df, _size in c] for c in chunks), workers)
+
+
+def resolve_cache_dir(a: CLArgs) -> Optional[str]:
+    if a.no_cache:
+        return None
+    if a.cache_dir is not None:
+        return a.cache_dir
+    env_cache_dir = os.environ.get("DVG_CACHE_DIR")
+    if env_cache_dir:
+        return env_cache_dir
+    if a.cache:
+        return appdirs.user_cache_dir("dvg")
+    return None
+
+
+def make_line_cache(a: CLArgs) -> Optional[LineWordIdCache]:
+    if a.line_cache <= 0:
+        return None
+    return LineWordIdCache(a.line_cache * 1024 * 1024)
+
+
+def line_cache_counts(model: SCDVModel) -> Tuple[int, int]:
+    c = model.line_cache
+    return (c.hits, c.misses) if c is not None else (0, 0)
+
+
+def make_scanner(a: CLArgs) -> Scanner:
+    if a.cache_dir is None:
+        return Scanner(pdf_parts=pdf_parts_for(a.workers))
+    return Scanner(ExtractionCache(a.cache_dir, a.cache_size * 1024 * 1024), pdf_parts_for(a.workers))
+
+
+def lines_of_windows(lines: List[str], poss: List[Pos]) -> List[str]:
+    """
+    Returns the lines with the ones out of all windows replaced with empty lines, so that only the lines of
+    the windows (e.g., the ones satisfying the include/exclude conditions) are tokenized.
+    """
+    cover = np.zeros(len(lines) + 1, dtype=np.int64)
+    ps = np.array(poss, dtype=np.int64).reshape(-1, 2)
+    np.add.at(cover, ps[:, 0], 1)
+    np.add.at(cover, ps[:, 1], -1)
+    covered = np.cumsum(cover[:-1]) > 0
+    if np.all(covered):
+        return lines
+    return [L if c else "" for L, c in zip(lines, covered.tolist())]
+
+
+def penalized_paragraphs(
+    df: str,
+    lines: Optional[List[str]],
+    poss: List[Pos],
+    sims: List[float],
+    para_lens: List[int],
+    a: CLArgs,
+    sim_min_req: float,
+) -> List[SLPLD]:
+    slplds: List[SLPLD] = []
+    for pos, sim, para_len in zip(poss, sims, para_lens):
+        if sim < sim_min_req:
+            continue  # for pos, sim, para_len
+
+        if para_len < a.min_length:  # penalty for short paragraphs
+            sim = sim * para_len / a.min_length
+            if sim < sim_min_req:
+                continue  # for pos, sim, para_len
+
+        slplds.append((sim, para_len, pos, lines, df))
+    return slplds
+
+
+def pick_paragraphs(slplds: List[SLPLD], a: CLArgs) -> List[SLPLD]:
+    """
+    Picks up the paragraphs of a file to be search results, from the candidates in the order of positions.
+    """
+    if not slplds:
+        return slplds
+
+    if a.paragraph_search:
+        slplds = prune_overlapped_paragraphs(slplds)  # remove paragraphs that overlap
+        slplds.sort(reverse=True)
+        if a.top_k > 0:
+            del slplds[a.top_k :]
+    else:
+        slplds = [max(slplds)]  # extract only the most similar paragraphs in the file
+    return slplds
+
+
+def with_paragraph_lines(slplds: List[SLPLD], line_base: int = 0) -> List[SLPLD]:
+    """
+    Replaces the lines of each search result (the lines of the document, or of a block of it beginning at
+    `line_base`) with the lines of the paragraph.
+    """
+    # a search result carries only the lines of the paragraph, not the whole document, so that
+    # search results are small to be sent from a worker process and to be kept until output
+    return [
+        (sim, para_len, (b + line_base, e + line_base), lines[b:e] if lines is not None else None, df)
+        for sim, para_len, (b, e), lines, df in slplds
+    ]
+
+
+def select_paragraphs(
+    df: str,
+    lines: Optional[List[str]],
+    poss: List[Pos],
+    sims: List[float],
+    para_lens: List[int],
+    a: CLArgs,
+    sim_min_req: float,
+) -> List[SLPLD]:
+    slplds = penalized_paragraphs(df, lines, poss, sims, para_lens, a, sim_min_req)
+    return with_paragraph_lines(pick_paragraphs(slplds, a))
+
+
+def iter_document_windows(
+    doc_files: Iterable[str], scanner: Scanner, a: CLArgs, prefetch_stats: Optional[PrefetchStats] = None
+) -> Iterator[Tuple[str, int, List[str], List[Pos], bool]]:
+    """
+    Reads each document file, and yields the lines of it and the windows that satisfy the include/exclude
+    conditions, as `(file, line_base, lines, windows, last)`.
+
+    A document file is usually yielded at once, with `line_base == 0` and `last == True`. A large plain text file
+    is read block by block in bounded memory, and yielded as blocks: `lines` are the lines of a block beginning at
+    line `line_base`, the windows are positions in the block, and the file ends with a block of `last == True`.
+
+    With option `--io-workers`, document files are read by threads, ahead of the caller scoring the previous ones,
+    so that reading and scoring overlap. Only waiting for the storage, or for pdftotext commands, overlaps; text
+    extracted by Python packages (HTML, DOCX, and PDF not split) holds the GIL.
+    """
+
+    # the include/exclude conditions are compiled once, and checked once for each document (or block)
+    conds = TextConditions(a.include, a.exclude)
+
+    def scan(df: str) -> Optional[List[str]]:
+        return None if scanner.is_streamed(df) else scanner.scan(df)
+
+    if a.io_workers >= 1:
+        max_pending = a.io_workers * 2
+        futs = prefetch_map(scan, doc_files, a.io_workers, max_pending, prefetch_stats)
+        scans: Iterator[Tuple[str, Callable[[], Optional[List[str]]]]] = ((df, fut.result) for df, fut in futs)
+    else:
+        scans = ((df, functools.partial(scan, df)) for df in doc_files)
+
+    for df, get_lines in scans:
         if a.vv:
             print(ANSI_ESCAPE_CLEAR_CUR_LINE + "[Warning] reading: %s" % df, file=sys.stderr, flush=True)
 
         # read lines from document file
         try:
-            lines = scanner.scan(df)
-        except ScanErrorNotFile as e:
+            lines = get_lines()
+        except ScanErrorNotFile:
             continue
         except ScanError as e:
             print(ANSI_ESCAPE_CLEAR_CUR_LINE + "[Warning] %s" % e, file=sys.stderr, flush=True)
             continue
 
-        # for each paragraph in the file, calculate the similarity to the query
-        slplds: List[SLPLD] = []
-        for pos in sliding_window_iter(len(lines), a.window):
-            para = lines[pos[0] : pos[1]]
-            para_len = sum(len(L) for L in para)
-            if (
-                a.include
-                and not includes_all_texts(para, a.include)
-                or a.exclude
-                and includes_any_of_texts(para, a.exclude)
-            ):
-                continue  # for pos, para
-
-            sim = model.similarity_to_lines(para)
-            if sim < sim_min_req:
-                continue  # for pos, para
+        if lines is None:  # a large file
+            line_base = 0
+            try:
+                for line_base, lines, poss in rolling_window_iter(scanner.scan_blocks(df), a.window):
+                    if conds:
+                        poss = conds.windows_satisfying(lines, poss)
+                    yield df, line_base, lines, poss, False
+            except ScanError as e:
+                print(ANSI_ESCAPE_CLEAR_CUR_LINE + "[Warning] %s" % e, file=sys.stderr, flush=True)
+            yield df, line_base, [], [], True
+            continue  # for df
 
-            if para_len < a.min_length:  # penalty for short paragraphs
-                sim = sim * para_len / a.min_length
-                if sim < sim_min_req:
-                    continue  # for pos, para
+        # pick up the paragraphs in the file that satisfy the include/exclude conditions.
+        # a file missing a text to be included is dropped before making the windows.
+        if conds:
+            poss = conds.windows_satisfying(lines, sliding_window_iter(len(lines), a.window))
+        else:
+            poss = list(sliding_window_iter(len(lines), a.window))
+        if not poss:
+            continue  # for df
 
-            slplds.append((sim, para_len, pos, lines, df))
+        yield df, 0, lines, poss, True
 
-        if not slplds:
-            continue  # for df
 
-        # pick up paragraphs for the file
-        if a.paragraph_search:
-            slplds = prune_overlapped_paragraphs(slplds)  # remove paragraphs that overlap
-            slplds.sort(reverse=True)
-            del slplds[a.top_k :]
+def candidate_paragraphs(
+    df: str,
+    lines: List[str],
+    poss: List[Pos],
+    sims: np.ndarray,
+    line_offsets: np.ndarray,
+    a: CLArgs,
+    sim_min_req: float,
+) -> List[SLPLD]:
+    # the paragraphs less similar than required can not be in the search results,
+    # so they are dropped before calculating their lengths and penalties
+    cands = np.flatnonzero(sims >= sim_min_req)
+    if cands.size == 0:
+        return []
+    cand_poss = [poss[i] for i in cands.tolist()]
+    ps = np.array(cand_poss, dtype=np.int64)
+    para_lens = line_offsets[ps[:, 1]] - line_offsets[ps[:, 0]]
+    return penalized_paragraphs(df, lines, cand_poss, sims[cands].tolist(), para_lens.tolist(), a, sim_min_req)
+
+
+def select_candidate_paragraphs(
+    df: str,
+    lines: List[str],
+    poss: List[Pos],
+    sims: np.ndarray,
+    line_offsets: np.ndarray,
+    a: CLArgs,
+    sim_min_req: float,
+) -> List[SLPLD]:
+    slplds = candidate_paragraphs(df, lines, poss, sims, line_offsets, a, sim_min_req)
+    return with_paragraph_lines(pick_paragraphs(slplds, a))
+
+
+def select_block_candidate_paragraphs(
+    df: str,
+    line_base: int,
+    lines: List[str],
+    poss: List[Pos],
+    sims: np.ndarray,
+    line_offsets: np.ndarray,
+    a: CLArgs,
+    sim_min_req: float,
+) -> List[SLPLD]:
+    """
+    Returns the candidates of search results in a block of a file. The search results of the file are picked up
+    from the candidates of all blocks, with `pick_paragraphs`.
+    """
+    slplds = candidate_paragraphs(df, lines, poss, sims, line_offsets, a, sim_min_req)
+    if not a.paragraph_search:
+        slplds = pick_paragraphs(slplds, a)  # the most similar one in the file is the most similar one in a block
+    return with_paragraph_lines(slplds, line_base)
+
+
+def line_char_offsets(lines: List[str]) -> np.ndarray:
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(L) for L in lines], out=offsets[1:])
+    return offsets
+
+
+def coarse_to_fine_windows(
+    line_count: int,
+    poss: List[Pos],
+    a: CLArgs,
+    coarse_similarities: Callable[[List[Pos]], np.ndarray],
+    sim_min_reqs: Sequence[float],
+) -> List[Pos]:
+    """
+    Returns the windows (of `poss`) worth scoring, found by scoring the windows `a.coarse` times as large first.
+    `coarse_similarities` returns the similarities of the given windows to each query, as an array of shape
+    (number of queries, number of windows).
+
+    The similarity of a coarse window is diluted by the lines in it but out of a (fine) window. When these lines
+    are unrelated to the query, i.e., their vector is nearly orthogonal to the one of the window, the similarity
+    of the window is about `sqrt(a.coarse)` times the one of the coarse window. So the windows in the coarse
+    windows less similar than `sim_min_req / sqrt(a.coarse)` are skipped. This is an estimate, not a bound,
+    and a window may be missed when the rest of the coarse window is dissimilar to the query.
+    """
+    coarse_poss = list(sliding_window_iter(line_count, a.window * a.coarse))
+    if len(coarse_poss) * 2 >= len(poss):
+        return poss  # not worth it
+
+    simss = coarse_similarities(coarse_poss)
+    reqs = np.array(sim_min_reqs, dtype=np.float64)[:, None] / math.sqrt(a.coarse)
+    promising = np.any(simss >= reqs, axis=0)
+    if np.all(promising):
+        return poss
+
+    # the lines covered by the promising coarse windows
+    cover = np.zeros(line_count + 1, dtype=np.int64)
+    for (b, e), p in zip(coarse_poss, promising.tolist()):
+        if p:
+            cover[b] += 1
+            cover[e] -= 1
+    covered = np.zeros(line_count + 1, dtype=np.int64)
+    np.cumsum(np.cumsum(cover)[:-1] > 0, out=covered[1:])
+    return [(b, e) for b, e in poss if covered[e] > covered[b]]
+
+
+def find_similar_paragraphs(
+    doc_files: Iterable[str],
+    model: SCDVModel,
+    a: CLArgs,
+    shared_sim_min_reqs: Optional[Sequence[float]] = None,
+    prefetch_stats: Optional[PrefetchStats] = None,
+) -> List[List[SLPLD]]:
+    """
+    Searches for the query set with `SCDVModel.set_query`, or each of the queries set with `SCDVModel.set_queries`.
+    Returns the search results of each query.
+
+    `shared_sim_min_reqs[q]`, if given, is the similarity of the k-th search result of the q-th query among all
+    worker processes, which is updated by the parent process.
+    """
+    scanner = make_scanner(a)
+
+    query_count = len(model.query_models) or 1
+    search_results = [TopKCollector(a.top_k) for _ in range(query_count)]
+    sim_min_reqs = [0.5] * query_count
+    file_candss: Optional[List[List[SLPLD]]] = None  # candidates in the blocks of a large file, of each query
+    for df, line_base, lines, poss, last in iter_document_windows(doc_files, scanner, a, prefetch_stats):
+        if shared_sim_min_reqs is not None and file_candss is None:
+            sim_min_reqs = [max(r, sr) for r, sr in zip(sim_min_reqs, shared_sim_min_reqs)]
+
+        # each line is tokenized only once, and the paragraphs are scored for all queries
+        if poss:
+            lw = model.lines_to_word_ids(lines_of_windows(lines, poss) if a.include or a.exclude else lines)
+            poss = model.windows_to_score(lw, poss)
+        if a.coarse >= 2 and poss:
+            poss = coarse_to_fine_windows(
+                len(lines),
+                poss,
+                a,
+                lambda cposs: model.similarities_to_windows_of_queries(lw, cposs, True),
+                sim_min_reqs,
+            )
+        if poss:
+            simss = model.similarities_to_windows_of_queries(lw, poss, True)
         else:
-            slplds = [max(slplds)]  # extract only the most similar paragraphs in the file
+            simss = np.zeros((query_count, 0))
+        line_offsets = line_char_offsets(lines)
+
+        if file_candss is None and not last:
+            file_candss = [[] for _ in range(query_count)]
+        for q in range(query_count):
+            if file_candss is None:
+                slplds = select_candidate_paragraphs(df, lines, poss, simss[q], line_offsets, a, sim_min_reqs[q])
+            else:
+                file_candss[q].extend(
+                    select_block_candidate_paragraphs(
+                        df, line_base, lines, poss, simss[q], line_offsets, a, sim_min_reqs[q]
+                    )
+                )
+                if not last:
+                    continue  # for q
+                slplds = pick_paragraphs(file_candss[q], a)
+            search_results[q].extend(slplds)
+            sim_min_reqs[q] = max(sim_min_reqs[q], search_results[q].threshold())
+        if last:
+            file_candss = None
+
+    r = [srs.results() for srs in search_results]
+    for srs in search_results:
+        srs.close()
+    return r
+
+
+def find_similar_paragraphs_in_index(
+    index: SearchIndex, model: SCDVModel, a: CLArgs, search_results: TopKCollector
+) -> None:
+    scanner = make_scanner(a)
+    conds = TextConditions(a.include, a.exclude)
+
+    # score all windows in the index at once, and pick up the candidates
+    sims = index.similarities(model, positive_only=True)
+    windows = np.asarray(index.windows)
+    para_lens = windows[:, W_PARA_LEN]
+    penalized_sims = np.where(para_lens < a.min_length, sims * para_lens / max(1, a.min_length), sims)
+    cands = np.flatnonzero(penalized_sims >= 0.5)
+    if cands.size == 0:
+        return
+    cands = cands[np.argsort(windows[cands, W_FILE], kind="stable")]  # group the candidates by file
+    cand_file_ids, file_starts = np.unique(windows[cands, W_FILE], return_index=True)
+    file_ends = np.append(file_starts[1:], cands.size)
+    file_bests = np.maximum.reduceat(penalized_sims[cands], file_starts)
 
-        # update search results
+    # pick up paragraphs file by file, in the order of the most similar paragraph of each file
+    for g in np.argsort(-file_bests, kind="stable").tolist():
+        if file_bests[g] < search_results.threshold():
+            break  # for g
+
+        df = index.files[cand_file_ids[g]].path
+        wis = cands[file_starts[g] : file_ends[g]]
+        poss = [(b, e) for b, e in windows[wis, W_BEGIN : W_END + 1].tolist()]
+
+        # the lines of the file are needed only for checking the include/exclude conditions.
+        # otherwise, they are read when the search results are printed.
+        lines = None
+        if conds:
+            try:
+                lines = scanner.scan(df)
+            except (ScanError, FileNotFoundError) as e:
+                print(ANSI_ESCAPE_CLEAR_CUR_LINE + "[Warning] %s" % e, file=sys.stderr, flush=True)
+                continue  # for g
+            in_file = [i for i, pos in enumerate(poss) if pos[1] <= len(lines)]  # the file may be modified
+            sat = [in_file[i] for i in np.flatnonzero(conds.satisfied(lines, [poss[i] for i in in_file])).tolist()]
+            wis = wis[sat]
+            poss = [poss[i] for i in sat]
+
+        slplds = select_paragraphs(df, lines, poss, sims[wis].tolist(), para_lens[wis].tolist(), a, 0.5)
         search_results.extend(slplds)
-        if len(search_results) >= a.top_k * (2 if sim_min_req > 0.5 else 1):
-            trim_search_results(search_results, a.top_k)
-            sim_min_req = search_results[-1][0]
 
-    trim_search_results(search_results, a.top_k)
-    return search_results
 
+def index_documents(
+    doc_files: Iterable[str], model: SCDVModel, a: IndexCLArgs
+) -> List[Tuple[IndexedFile, DocumentIndexData]]:
+    scanner = Scanner(pdf_parts=pdf_parts_for(a.workers))
 
-def find_similar_paragraphs_i(arg_tuple):
-    # (dfs, model, a) = arg_tuple
-    r = find_similar_paragraphs(*arg_tuple)
-    return r, arg_tuple[0]
+    r = []
+    for df in doc_files:
+        try:
+            f = indexed_file_of(df, content_hash=a.hash)
+            lines = scanner.scan(df)
+        except ScanErrorNotFile:
+            continue
+        except (ScanError, FileNotFoundError) as e:
+            print(ANSI_ESCAPE_CLEAR_CUR_LINE + "[Warning] %s" % e, file=sys.stderr, flush=True)
+            continue
+        r.append((f, index_document(lines, model, a.window)))
+    return r
 
 
-def main():
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding=sys.stdout.encoding, errors="replace")
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding=sys.stderr.encoding, errors="replace")
+_worker_model: Optional[SCDVModel] = None
+_worker_args: Optional[Union[CLArgs, IndexCLArgs]] = None
+_worker_shms: List[SharedMemory] = []
+_worker_sim_min_reqs: Optional[Sequence[float]] = None
 
-    argv = sys.argv[1:]
-    for i, a in enumerate(argv):
-        if a == "--bin-dir":
-            print(os.path.join(_script_dir, "bin"))
-            return
-        if a == "--model-dir":
-            print(os.path.join(_script_dir, "models"))
-            return
-        if a == "--expand-wildcard":
-            file_pats = argv[i + 1 :]
-            for fp in file_pats:
-                print("%s:" % fp)
-                for f in expand_file_iter([fp], windows_style=True):
-                    print("    %s" % f)
-            return
 
-    # A charm to make ANSI escape sequences work on Windows
-    if platform.system() == "Windows":
-        import colorama
+def init_worker(
+    model_handle: SharedModelHandle,
+    a: Union[CLArgs, IndexCLArgs],
+    shared_sim_min_reqs: Optional[Sequence[float]] = None,
+) -> None:
+    # called once in each worker process of the pool.
+    # the model is attached from the shared memory, and it (and the tokenizer loaded lazily at the first task)
+    # is kept for the lifetime of the worker, so that each task only needs to carry the names of document files.
+    global _worker_model, _worker_args, _worker_shms, _worker_sim_min_reqs
+    _worker_model, _worker_shms = attach_model(model_handle)
+    _worker_args = a
+    _worker_sim_min_reqs = shared_sim_min_reqs
+    if isinstance(a, CLArgs):
+        _worker_model.line_cache = make_line_cache(a)
 
-        colorama.init()
 
-    # command-line analysis
-    raw_args = docopt(__doc__, argv=argv, version="dvg %s" % VERSION)
-    a = CLArgs(_cast_str_values=True, **raw_args)
+# a result of a search task: the search results of each query, the document files, the backpressure of reading
+# documents, and the numbers of hits and misses of the line cache in the task
+SearchTaskResult = Tuple[List[List[SLPLD]], List[str], PrefetchStats, Tuple[int, int]]
 
-    # backward compatibility issue
-    if a.top_n is not None:
-        a.top_k = a.top_n
+
+def find_similar_paragraphs_w(dfs: List[str]) -> SearchTaskResult:
+    assert _worker_model is not None and _worker_args is not None, "init_worker() is not called"
+    stats = PrefetchStats()
+    hits, misses = line_cache_counts(_worker_model)
+    r = find_similar_paragraphs(dfs, _worker_model, _worker_args, _worker_sim_min_reqs, stats)
+    h, m = line_cache_counts(_worker_model)
+    return r, dfs, stats, (h - hits, m - misses)
+
+
+def index_documents_w(dfs: List[str]) -> Tuple[List[Tuple[IndexedFile, DocumentIndexData]], List[str]]:
+    assert _worker_model is not None and _worker_args is not None, "init_worker() is not called"
+    r = index_documents(dfs, _worker_model, _worker_args)
+    return r, dfs
+
+
+def index_main(argv: List[str]) -> None:
+    raw_args = docopt(__doc_index__, argv=argv, version="dvg %s" % VERSION)
+    a = IndexCLArgs(_cast_str_values=True, **raw_args)
+
+    # option -w has no default in the usage, so that a window size given to update an index can be checked
+    window_given = a.window is not None
+    if not window_given:
+        a.window = DEFAULT_WINDOW_SIZE
+
+    old_index = None
+    if index_exists(a.indexdir):
+        if not a.update:
+            sys.exit("Error: index already exists (use option --update): %s" % a.indexdir)
+        try:
+            old_index = SearchIndex(a.indexdir)
+        except SearchIndexError as e:
+            sys.exit(str(e))
+        if window_given and a.window != old_index.window:
+            sys.exit("Error: the index is built with another window size (option -w): %d" % old_index.window)
+        a.window = old_index.window
+        a.hash = a.hash or old_index.content_hash
 
     model_spec = do_find_model_spec(a.model)
-    tokenizer, model_file = model_spec.tokenizer_name, model_spec.file_path
-    model = SCDVModel(tokenizer, model_file)
+    if old_index is not None and (old_index.model_name, old_index.model_version) != (a.model, model_spec.version):
+        sys.exit(
+            "Error: the index is built with another model: %s %s" % (old_index.model_name, old_index.model_version)
+        )
+    model = SCDVModel(model_spec.tokenizer_name, model_spec.file_path)
+    vocab_size = model.embedder.cluster_idf_wvs.shape[0]
+    generation = old_index.generation + 1 if old_index is not None else 0
+    writer = SearchIndexWriter(a.indexdir, a.model, model_spec.version, vocab_size, a.window, a.hash, generation)
 
-    # diagnostic mode
-    if a.diagnostic:
-        print("%s %s" % (a.model, str(model_spec)))
+    target_files: Iterable[Tuple[str, Optional[int]]] = expand_file_size_iter(
+        a.file, windows_style=not a.unix_wildcard, min_size=a.min_file_size, max_size=a.max_file_size
+    )
+    count_reused_files = count_removed_files = 0
+    if old_index is not None:
+        # copy the data of the unchanged files from the old index, and scan only the files added or modified
+        old_file_ids = dict((f.path, i) for i, f in enumerate(old_index.files))
+        files_to_scan = []
+        for df, size in target_files:
+            i = old_file_ids.pop(df, None)
+            if i is not None:
+                unchanged, f = is_file_unchanged(old_index.files[i])
+                if unchanged:
+                    if a.hash and not f.sha256:
+                        f = indexed_file_of(df, content_hash=True)
+                    writer.add_document(f, old_index.document_data(i))
+                    count_reused_files += 1
+                    continue  # for df
+            files_to_scan.append((df, size))
+        count_removed_files = len(old_file_ids)
+        target_files = files_to_scan
+        old_index.close()
+
+    count_document_files = 0
+    chunk_size = 1000
+    shms = None
+    t0 = time()
+    try:
+        if a.workers and a.workers >= 2:
+            dfs_it = scheduled_chunked_iter(target_files, chunk_size, a.workers)
+            model_handle, shms = share_model(model)
+            with Pool(processes=a.workers, initializer=init_worker, initargs=(model_handle, a)) as pool:
+                for fds, dfs in pool.imap(index_documents_w, dfs_it):
+                    for f, d in fds:
+                        writer.add_document(f, d)
+                    count_document_files += len(dfs)
+                    if a.verbose:
+                        print_intermediate_progress(count_document_files, time() - t0)
+        else:
+            for dfs in chunked_iter((df for df, _size in target_files), chunk_size):
+                for f, d in index_documents(dfs, model, a):
+                    writer.add_document(f, d)
+                count_document_files += len(dfs)
+                if a.verbose:
+                    print_intermediate_progress(count_document_files, time() - t0)
+    except FileNotFoundError as e:
+        sys.exit(str(e))
+    finally:
+        if shms is not None:
+            close_shared_memories(shms, unlink=True)
+    writer.close()
+
+    if a.verbose:
         print(
-            "[Warning] Try to load tokenize function (may cause downloading data files).", file=sys.stderr, flush=True
+            ANSI_ESCAPE_CLEAR_CUR_LINE
+            + "[Info] number of indexed files: %d, windows: %d" % (len(writer.files), writer.window_count),
+            file=sys.stderr,
+            flush=True,
         )
-        load_tokenize_func(a.model)
-        print("[Info] Done.", file=sys.stderr, flush=True)
-        sys.exit(0)
+        if old_index is not None:
+            print(
+                "[Info] files scanned: %d, unchanged: %d, removed: %d"
+                % (count_document_files, count_reused_files, count_removed_files),
+                file=sys.stderr,
+                flush=True,
+            )
+
+
+def read_queries_file(queries_file: str) -> List[str]:
+    if queries_file == "-":
+        text = sys.stdin.read()
+    else:
+        try:
+            text = read_text_file(queries_file)
+        except OSError as e:
+            sys.exit("Error in reading queries file: %s" % e)
+    queries = [q.strip() for q in text.splitlines()]
+    queries = [q for q in queries if q]
+    if not queries:
+        sys.exit("Error: no queries in the file: %s" % queries_file)
+    return queries
 
-    lines = do_extract_query_lines(a.query, a.query_file)
-    model.set_query(lines)
+
+def iter_search_result_records(
+    search_results: Iterable[SLPLD],
+    model: SCDVModel,
+    a: CLArgs,
+    index: Optional[SearchIndex],
+    scanner: Scanner,
+) -> Iterator[SearchResultRecord]:
+    """
+    Makes the search results to be shown, one by one, so that they can be printed without being kept in memory.
+    The lines of a search result found in the index are read from the document file. Only the lines of the last
+    document read are kept, for the following search results in the same document.
+    """
+    indexed_files = dict((f.path, f) for f in index.files) if index is not None else dict()
+    scanned_df: Optional[str] = None
+    scanned_lines: Optional[List[str]] = None
+    for sim, para_len, (b, e), para, df in search_results:
+        if sim < 0.5:
+            break
+        if para is None:  # a result found in the index
+            if df != scanned_df:
+                scanned_df, scanned_lines = df, None
+                try:
+                    if not is_file_unchanged(indexed_files[df])[0]:
+                        print("[Warning] file modified after indexing: %s" % df, file=sys.stderr, flush=True)
+                    scanned_lines = scanner.scan(df)
+                except (ScanError, FileNotFoundError) as ex:
+                    print("[Warning] %s" % ex, file=sys.stderr, flush=True)
+            if scanned_lines is None:
+                continue  # for sim, ...
+            para = scanned_lines[b:e]
+        if a.quote:
+            text: Union[str, List[str]] = [unicodedata.normalize("NFKC", L) for L in para]
+        else:
+            excerpt = excerpt_text(para, model.similarities_to_line_ranges, a.excerpt_length)
+            text = unicodedata.normalize("NFKC", excerpt)
+        yield SearchResultRecord(sim, para_len, df, b + 1, e, text)
+
+
+def search(
+    a: CLArgs, model: SCDVModel, model_version: str, queries: Optional[List[str]] = None
+) -> Iterator[Iterator[SearchResultRecord]]:
+    """
+    Searches the documents (or the index) for the paragraphs similar to the query, which are given as the
+    command-line arguments, or for each of `queries`. Yields the search results of each query, as an iterator
+    which should be consumed before the next one, so that the search results are not kept in memory.
+    The model should not be optimized for another query, e.g., by a previous search.
+    """
+    index = None
+    if a.index_dir is not None:
+        try:
+            index = SearchIndex(a.index_dir)
+        except SearchIndexError as e:
+            sys.exit(str(e))
+        if (index.model_name, index.model_version) != (a.model, model_version):
+            sys.exit(
+                "Error: the index is built with another model: %s %s" % (index.model_name, index.model_version)
+            )
+        if a.window_given and a.window != index.window:
+            sys.exit("Error: the index is built with another window size (option -w): %d" % index.window)
+
+    model.line_cache = make_line_cache(a)
+    if queries is None:
+        lines = do_extract_query_lines(a.query, a.query_file)
+        model.set_query(lines)
+        query_models = [model]
+    else:
+        model.set_queries([to_lines(q) for q in queries])
+        query_models = model.query_models
 
     count_document_files = 0
     chunk_size = 10000
     shms = None
+    search_results = [TopKCollector(a.top_k) for _ in query_models]
     try:
         # search for document files that are similar to the query
         if a.verbose:
             print("", end="", file=sys.stderr, flush=True)
-        search_results: List[SLPLD] = []
+
+        # the similarity of the k-th search result of each query, shared with worker processes
+        shared_sim_min_reqs = None
+
+        prefetch_stats = PrefetchStats()
+        line_cache_hits_misses = [0, 0]
+
+        def update_search_results(srss: List[List[SLPLD]], done_files: int) -> None:
+            for q, (search_results_q, srs) in enumerate(zip(search_results, srss)):
+                search_results_q.extend(srs)
+                if shared_sim_min_reqs is not None and search_results_q.is_full():
+                    shared_sim_min_reqs[q] = max(shared_sim_min_reqs[q], search_results_q.threshold())
+            if a.verbose:
+                if queries is None:
+                    print_intermediate_search_result(search_results[0].best(), done_files, time() - t0)
+                else:
+                    print_intermediate_progress(done_files, time() - t0)
+
         t0 = time()
         try:
-            if a.workers and a.workers >= 2:
-                shms = model_shared(model)  # load the model into shared memory for process parallel
-                args_it = (
-                    (dfs, model, a)
-                    for dfs in para_chunked_iter(
-                        expand_file_iter(a.file, windows_style=not a.unix_wildcard), chunk_size, a.workers
-                    )
+            if index is not None:
+                for search_results_q, m in zip(search_results, query_models):
+                    find_similar_paragraphs_in_index(index, m, a, search_results_q)
+                count_document_files = len(index.files)
+            elif a.workers and a.workers >= 2:
+                model_handle, shms = share_model(model)  # load the model into shared memory for process parallel
+                shared_sim_min_reqs = Array("d", [0.5] * len(query_models), lock=False)
+                dfs_it = scheduled_chunked_iter(
+                    expand_file_size_iter(
+                        a.file, windows_style=not a.unix_wildcard, min_size=a.min_file_size, max_size=a.max_file_size
+                    ),
+                    chunk_size,
+                    a.workers,
                 )
-                with Pool(processes=a.workers) as pool:
-                    for srs, dfs in pool.imap_unordered(find_similar_paragraphs_i, args_it):
-                        search_results.extend(srs)
-                        trim_search_results(search_results, a.top_k)
+                initargs = (model_handle, a, shared_sim_min_reqs)
+                with Pool(processes=a.workers, initializer=init_worker, initargs=initargs) as pool:
+                    for srss, dfs, stats, hm in pool.imap_unordered(find_similar_paragraphs_w, dfs_it):
                         count_document_files += len(dfs)
-                        if a.verbose:
-                            print_intermediate_search_result(search_results, count_document_files, time() - t0)
+                        prefetch_stats.add(stats)
+                        line_cache_hits_misses = [c + d for c, d in zip(line_cache_hits_misses, hm)]
+                        update_search_results(srss, count_document_files)
             else:
-                for dfs in chunked_iter(expand_file_iter(a.file), chunk_size):
-                    search_results.extend(find_similar_paragraphs(dfs, model, a))
-                    trim_search_results(search_results, a.top_k)
+                target_files = expand_file_iter(a.file, min_size=a.min_file_size, max_size=a.max_file_size)
+                for dfs in chunked_iter(target_files, chunk_size):
+                    srss = find_similar_paragraphs(dfs, model, a, prefetch_stats=prefetch_stats)
                     count_document_files += len(dfs)
-                    if a.verbose:
-                        print_intermediate_search_result(search_results, count_document_files, time() - t0)
+                    update_search_results(srss, count_document_files)
         except FileNotFoundError as e:
             if a.verbose:
                 print(ANSI_ESCAPE_CLEAR_CUR_LINE, file=sys.stderr, flush=True)
@@ -332,28 +1055,180 @@ def main():
                 file=sys.stderr,
                 flush=True,
             )
+            if prefetch_stats.items > 0:
+                # many waits of scoring mean that reading documents is the bottleneck, and many stalls of
+                # reading mean that scoring is the bottleneck
+                ps = prefetch_stats
+                print(
+                    "[Info] scoring waited for reading: %d times (%.1fs), reading stalled by scoring: %d times"
+                    % (ps.consumer_waits, ps.consumer_wait_time, ps.producer_stalls),
+                    file=sys.stderr,
+                    flush=True,
+                )
+            if model.line_cache is not None:
+                hits, misses = [c + d for c, d in zip(line_cache_hits_misses, line_cache_counts(model))]
+                print(
+                    "[Info] line cache: hits %d, misses %d" % (hits, misses),
+                    file=sys.stderr,
+                    flush=True,
+                )
 
-        # output search results
-        trim_search_results(search_results, a.top_k)
-        if a.header:
-            print("\t".join(["sim", "chars", "location", "text"]))
-        for sim, para_len, (b, e), lines, df in search_results:
-            if sim < 0.5:
-                break
-            para = lines[b:e]
-            if a.quote:
-                print("%.4f\t%d\t%s:%d-%d" % (sim, para_len, df, b + 1, e))
-                for L in para:
-                    L = unicodedata.normalize("NFKC", L)
-                    print("> %s" % L)
-                print()
-            else:
-                excerpt = excerpt_text(para, model.similarity_to_lines, a.excerpt_length)
-                excerpt = unicodedata.normalize("NFKC", excerpt)
-                print("%.4f\t%d\t%s:%d-%d\t%s" % (sim, para_len, df, b + 1, e, excerpt))
+        # make the search results to be shown
+        scanner = make_scanner(a)
+        for search_results_q, m in zip(search_results, query_models):
+            yield iter_search_result_records(search_results_q.iter_results(), m, a, index, scanner)
     finally:
+        for search_results_q in search_results:
+            search_results_q.close()
         if shms is not None:
-            model_shared_close(shms)
+            close_shared_memories(shms, unlink=True)
+        if index is not None:
+            index.close()
+
+
+def parse_search_args(argv: List[str]) -> CLArgs:
+    raw_args = docopt(__doc__, argv=argv, version="dvg %s" % VERSION)
+    a = CLArgs(_cast_str_values=True, **raw_args)
+
+    # backward compatibility issue
+    if a.top_n is not None:
+        a.top_k = a.top_n
+
+    # option -w has no default in the usage, so that a window size given to search an index can be checked
+    a.window_given = a.window is not None
+    if not a.window_given:
+        a.window = DEFAULT_WINDOW_SIZE
+
+    a.cache_dir = resolve_cache_dir(a)
+    return a
+
+
+def serve_main(argv: List[str]) -> None:
+    raw_args = docopt(__doc_serve__, argv=argv, version="dvg %s" % VERSION)
+    a = ServeCLArgs(_cast_str_values=True, **raw_args)
+
+    model_spec = do_find_model_spec(a.model)
+    base_model = SCDVModel(model_spec.tokenizer_name, model_spec.file_path)
+    base_model.tokenizer = load_tokenize_func(base_model.tokenizer_name)
+
+    def handle_search(search_argv: List[str], cwd: str) -> List[SearchResultRecord]:
+        t0 = time()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):  # the usage is not printed to the output of the server
+                sa = parse_search_args(search_argv)
+        except SystemExit as e:
+            if e.code is None:  # --help or --version
+                sys.exit("Error: options --help and --version are not available in a search with a server")
+            raise
+        if sa.model != a.model:
+            sys.exit("Error: the server does not have the model: %s" % sa.model)
+        if sa.diagnostic:
+            sys.exit("Error: option --diagnostic is not available in a search with a server")
+        if sa.queries_file is not None:
+            sys.exit("Error: option --queries-file is not available in a search with a server")
+        if sa.query == "-" or sa.query_file == "-" or "-" in sa.file:
+            sys.exit("Error: the standard input is not available in a search with a server")
+        sa.verbose = sa.vv = False
+        sa.workers = None
+
+        # a model for each search. the embedder is shallow-copied, because optimization for a query
+        # replaces the arrays of the embedder, rather than modifies them
+        model = SCDVModel(base_model.tokenizer_name, embedder=copy.copy(base_model.embedder))
+        model.tokenizer = base_model.tokenizer
+
+        saved_cwd = os.getcwd()
+        os.chdir(cwd)
+        try:
+            records = [r for rs in search(sa, model, model_spec.version) for r in rs]
+        finally:
+            os.chdir(saved_cwd)
+        if a.verbose:
+            print("[Info] searched in %.3fs: %s" % (time() - t0, search_argv), file=sys.stderr, flush=True)
+        return records
+
+    token = make_server_token()
+    try:
+        server = make_search_server(a.port, handle_search, token)
+        token_file = write_token_file(a.port, token)
+    except OSError as e:
+        sys.exit("Error: failed to start the server: %s" % e)
+    print("[Info] Serving model %s on localhost port %d." % (a.model, a.port), file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(token_file):
+            os.remove(token_file)
+
+
+def main():
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding=sys.stdout.encoding, errors="replace")
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding=sys.stderr.encoding, errors="replace")
+
+    argv = sys.argv[1:]
+    if argv[:1] == ["index"]:
+        index_main(argv)
+        return
+    if argv[:1] == ["serve"]:
+        serve_main(argv)
+        return
+
+    for i, a in enumerate(argv):
+        if a == "--bin-dir":
+            print(os.path.join(_script_dir, "bin"))
+            return
+        if a == "--model-dir":
+            print(os.path.join(_script_dir, "models"))
+            return
+        if a == "--expand-wildcard":
+            file_pats = argv[i + 1 :]
+            for fp in file_pats:
+                print("%s:" % fp)
+                for f in expand_file_iter([fp], windows_style=True):
+                    print("    %s" % f)
+            return
+
+    # A charm to make ANSI escape sequences work on Windows
+    if platform.system() == "Windows":
+        import colorama
+
+        colorama.init()
+
+    # command-line analysis
+    a = parse_search_args(argv)
+
+    if a.remote:
+        try:
+            records = request_search(a.port, argv, os.getcwd())
+        except ServerError as e:
+            sys.exit(str(e))
+        print_search_result_records(records, a.header, a.quote)
+        return
+
+    model_spec = do_find_model_spec(a.model)
+    tokenizer, model_file = model_spec.tokenizer_name, model_spec.file_path
+    model = SCDVModel(tokenizer, model_file)
+
+    # diagnostic mode
+    if a.diagnostic:
+        print("%s %s" % (a.model, str(model_spec)))
+        print(
+            "[Warning] Try to load tokenize function (may cause downloading data files).", file=sys.stderr, flush=True
+        )
+        load_tokenize_func(a.model)
+        print("[Info] Done.", file=sys.stderr, flush=True)
+        sys.exit(0)
+
+    if a.queries_file is None:
+        for records in search(a, model, model_spec.version):
+            print_search_result_records(records, a.header, a.quote)
+    else:
+        queries = read_queries_file(a.queries_file)
+        for q, records in enumerate(search(a, model, model_spec.version, queries)):
+            print("# query: %s" % queries[q])
+            print_search_result_records(records, a.header, a.quote)
 
 
 if __name__ == "__main__":
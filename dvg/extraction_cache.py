@@ -0,0 +1,107 @@
+from typing import List, Optional, Tuple
+
+import hashlib
+import os
+import uuid
+
+
+# bump this when the output of text extraction (e.g., `to_lines`) changes, to invalidate old entries
+CACHE_FORMAT_VERSION = 1
+
+_ENTRY_SUFFIX = ".lines"
+
+
+class ExtractionCache:
+    """
+    On-disk cache of the lines extracted from document files (such as PDF files), which are costly to extract.
+
+    An entry is keyed by the absolute path, the size, and the modification time of a file, so that
+    a modified file does not hit a stale entry. The total size of the entries is capped, and when it
+    exceeds the cap, the least recently used entries are removed. The recency of an entry is recorded
+    as the modification time of the entry file, so that multiple processes can share a cache directory.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes: Optional[int] = None  # estimated lazily, on the first put
+
+    def _entry_path(self, file_name: str) -> Optional[str]:
+        try:
+            st = os.stat(file_name)
+        except OSError:
+            return None
+        key = "%d\0%s\0%d\0%d" % (CACHE_FORMAT_VERSION, os.path.abspath(file_name), st.st_size, st.st_mtime_ns)
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + _ENTRY_SUFFIX)
+
+    def get(self, file_name: str) -> Optional[List[str]]:
+        entry = self._entry_path(file_name)
+        if entry is not None:
+            try:
+                with open(entry, "rb") as inp:
+                    text = inp.read().decode("utf-8")
+                os.utime(entry)  # mark as recently used
+            except OSError:
+                pass  # not cached, or removed by another process
+            else:
+                self.hits += 1
+                return text.split("\n") if text else []
+        self.misses += 1
+        return None
+
+    def put(self, file_name: str, lines: List[str]) -> None:
+        entry = self._entry_path(file_name)
+        if entry is None:
+            return
+        data = "\n".join(lines).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        tempf = "%s.%s.tmp" % (entry, uuid.uuid4().hex)
+        try:
+            with open(tempf, "wb") as outp:
+                outp.write(data)
+            os.replace(tempf, entry)
+        except OSError:
+            if os.path.exists(tempf):
+                os.remove(tempf)
+            return
+
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+        else:
+            self._total_bytes += len(data)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self) -> List[Tuple[int, int, str]]:
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for de in it:
+                if de.name.endswith(_ENTRY_SUFFIX):
+                    try:
+                        st = de.stat()
+                    except OSError:
+                        continue  # for de
+                    entries.append((st.st_mtime_ns, st.st_size, de.path))
+        return entries
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the total size gets within the cap.
+        """
+        entries = self._entries()
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break  # for _, size, path
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # removed by another process
+            total -= size
+        self._total_bytes = total
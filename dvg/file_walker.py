@@ -0,0 +1,164 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+import os
+from queue import Empty, Full, Queue
+import sys
+from threading import Event, Lock
+
+
+# files of these extensions are picked up by walking a directory
+DOCUMENT_EXTENSIONS = [".txt", ".html", ".pdf", ".docx"]
+
+IGNORE_FILE = ".dvgignore"
+
+WALKER_THREADS = 8
+
+_QUEUE_SIZE = 0x1000
+_QUEUE_POLL_SECONDS = 0.1
+
+# a pattern of an ignore file: the directory containing the ignore file, the pattern, and whether it matches
+# only directories (written with a trailing "/")
+IgnoreRule = Tuple[str, str, bool]
+
+
+def read_ignore_file(dir_path: str) -> List[IgnoreRule]:
+    """
+    Reads the ignore file in the directory, if any. Each line of an ignore file is a wildcard pattern,
+    matched against the name of a file or a directory (or against the path relative to the directory of the
+    ignore file, when the pattern contains "/"). Empty lines and lines starting with "#" are skipped.
+    """
+    try:
+        with open(os.path.join(dir_path, IGNORE_FILE), "r", encoding="utf-8", errors="replace") as inp:
+            lines = inp.read().splitlines()
+    except OSError:
+        return []
+    rules: List[IgnoreRule] = []
+    for L in lines:
+        L = L.strip()
+        if not L or L.startswith("#"):
+            continue  # for L
+        dir_only = L.endswith("/")
+        pattern = L.strip("/")
+        if pattern:
+            rules.append((dir_path, pattern, dir_only))
+    return rules
+
+
+def is_ignored(path: str, name: str, is_dir: bool, rules: Sequence[IgnoreRule]) -> bool:
+    for base_dir, pattern, dir_only in rules:
+        if dir_only and not is_dir:
+            continue  # for base_dir, ...
+        if "/" in pattern:
+            rel_path = os.path.relpath(path, base_dir).replace(os.sep, "/")
+            if fnmatch(rel_path, pattern):
+                return True
+        elif fnmatch(name, pattern):
+            return True
+    return False
+
+
+def walk_document_files(
+    top: str,
+    extensions: Sequence[str] = DOCUMENT_EXTENSIONS,
+    min_size: int = 0,
+    max_size: Optional[int] = None,
+    threads: int = WALKER_THREADS,
+) -> Iterator[str]:
+    """
+    Finds the document files in the directory recursively, and yields the paths of them as they are found.
+    See `walk_document_file_sizes`.
+    """
+    for path, _size in walk_document_file_sizes(top, extensions, min_size, max_size, threads):
+        yield path
+
+
+def walk_document_file_sizes(
+    top: str,
+    extensions: Sequence[str] = DOCUMENT_EXTENSIONS,
+    min_size: int = 0,
+    max_size: Optional[int] = None,
+    threads: int = WALKER_THREADS,
+) -> Iterator[Tuple[str, int]]:
+    """
+    Finds the document files in the directory recursively, and yields the paths and the sizes of them as they
+    are found.
+
+    Directories are read with `os.scandir` by a pool of threads, so that reading directories on a slow
+    (e.g., network) file system overlaps. The file type and the size of each entry are taken from
+    the `DirEntry`, which saves a stat call for each file on most platforms. Files and directories that
+    match the patterns of ignore files (`.dvgignore`) are skipped. Symbolic links to directories are not
+    followed. The order of the paths is not deterministic with multiple threads.
+    """
+    assert threads >= 1
+    exts = [e.lower() for e in extensions]
+    que: "Queue[Optional[Tuple[str, int]]]" = Queue(maxsize=_QUEUE_SIZE)
+    stopped = Event()  # set when the consumer stops iterating
+    lock = Lock()
+    pending = [0]  # number of directories submitted and not yet read
+
+    def put(item: Optional[Tuple[str, int]]) -> None:
+        while not stopped.is_set():
+            try:
+                que.put(item, timeout=_QUEUE_POLL_SECONDS)
+                return
+            except Full:
+                pass
+
+    def submit(dir_path: str, rules: List[IgnoreRule]) -> None:
+        with lock:
+            pending[0] += 1
+        try:
+            executor.submit(scan_dir, dir_path, rules)
+        except RuntimeError:  # the executor is shut down, as the consumer has stopped
+            with lock:
+                pending[0] -= 1
+
+    def scan_dir(dir_path: str, rules: List[IgnoreRule]) -> None:
+        try:
+            if stopped.is_set():
+                return
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                print("[Warning] can not read directory: %s" % e, file=sys.stderr, flush=True)
+                return
+
+            if any(e.name == IGNORE_FILE for e in entries):
+                rules = rules + read_ignore_file(dir_path)
+            for e in entries:
+                try:
+                    is_dir = e.is_dir(follow_symlinks=False)
+                    if rules and is_ignored(e.path, e.name, is_dir, rules):
+                        continue  # for e
+                    if is_dir:
+                        submit(e.path, rules)
+                    elif os.path.splitext(e.name)[1].lower() in exts and e.is_file():
+                        size = e.stat().st_size
+                        if min_size <= size and (max_size is None or size <= max_size):
+                            put((e.path, size))
+                except OSError:
+                    continue  # for e, removed during the walk
+        finally:
+            with lock:
+                pending[0] -= 1
+                done = pending[0] == 0
+            if done:
+                put(None)
+
+    executor = ThreadPoolExecutor(max_workers=threads)
+    try:
+        submit(top, [])
+        while True:
+            try:
+                path_size = que.get(timeout=_QUEUE_POLL_SECONDS)
+            except Empty:
+                continue  # while True
+            if path_size is None:
+                break  # while True
+            yield path_size
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True)
@@ -1,10 +1,14 @@
-from typing import Iterable, Iterator, List, Tuple, TypeVar
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
-from queue import Empty, Queue
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue
 from threading import Thread
+from time import time
 
 
 T = TypeVar("T")
+U = TypeVar("U")
 
 
 # def remove_non_first_appearances(lst: Iterable[T]) -> List[T]:
@@ -41,38 +45,144 @@ def chunked_iter(it: Iterable[T], max_chunk_size: int) -> Iterator[List[T]]:
         yield chunk
 
 
-def _chunk_producer(chunk_que, it, max_chunk_size):
-    chunk_size = 10
-    chunk = []
-    for item in it:
-        chunk.append(item)
-        if len(chunk) >= chunk_size:
-            chunk_que.put(chunk)
-            chunk = []
-            chunk_size = min(max_chunk_size, chunk_size * 3 // 2)
-    if chunk:
-        chunk_que.put(chunk)
-    chunk_que.put(None)
+_END = object()
 
 
-def para_chunked_iter(it: Iterable[T], max_chunk_size: int, max_para: int) -> Iterator[List[T]]:
+def _producer(que, it):
+    for item in it:
+        que.put(item)
+    que.put(_END)
+
+
+def threaded_iter(it: Iterable[T], max_pending: int) -> Iterator[T]:
+    """
+    Iterates the items, which are produced by a thread up to `max_pending` items ahead of the consumer.
+    """
+    que = Queue(maxsize=max_pending)
+
+    producer_th = Thread(target=_producer, args=(que, it), daemon=True)
+    producer_th.start()
+
+    while True:
+        item = que.get()
+        if item is _END:
+            break  # while True
+        yield item
+
+    producer_th.join()
+
+
+def weighted_chunked_iter(
+    it: Iterable[T],
+    weight: Callable[[T], float],
+    max_chunk_weight: float,
+    max_chunk_size: int,
+    lookahead: int,
+    parts: int = 1,
+) -> Iterator[List[T]]:
+    """
+    Groups the items into chunks by their weights (the estimated costs of processing them).
+
+    The items are read into a buffer, which is small at first (so that the first chunks are yielded without
+    waiting for many items) and grows up to `lookahead` items. The items of a buffer are packed into chunks up to
+    `max_chunk_weight`, `max_chunk_size` items, and 1/`parts` of the weight of the buffer, so that a buffer is split
+    into at least `parts` chunks (e.g., a few times the number of the worker processes) to be processed in parallel.
+    An item heavier than that makes a chunk by itself. The chunks are yielded from the heaviest one, so that
+    the heavy ones are processed early, not left at the end (the longest-processing-time-first order).
+    """
     assert max_chunk_size >= 1
-    if max_para <= 1:
-        yield from chunked_iter(it, max_chunk_size)
-    else:
-        chunk_que = Queue(maxsize=max_para)
-
-        chunk_producer_th = Thread(target=_chunk_producer, args=(chunk_que, it, max_chunk_size))
-        chunk_producer_th.start()
-
-        while True:
-            chunk = chunk_que.get()
-            if chunk is None:
-                break  # while True
-            chunk_que.task_done()
-            yield chunk
-
-        chunk_producer_th.join()
+    assert lookahead >= 1
+    assert parts >= 1
+    items = iter(it)
+    buf_size = min(lookahead, max(10, parts))
+    while True:
+        buf = [(weight(item), i, item) for i, item in zip(range(buf_size), items)]
+        if not buf:
+            break  # while True
+        buf_size = min(lookahead, buf_size * 2)
+        buf.sort(key=lambda wii: (-wii[0], wii[1]))
+        chunk_weight_cap = min(max_chunk_weight, sum(w for w, _i, _item in buf) / parts)
+
+        chunks: List[Tuple[float, List[T]]] = []
+        chunk: List[T] = []
+        chunk_weight = 0.0
+        for w, _i, item in buf:
+            if chunk and (chunk_weight + w > chunk_weight_cap or len(chunk) >= max_chunk_size):
+                chunks.append((chunk_weight, chunk))
+                chunk = []
+                chunk_weight = 0.0
+            chunk.append(item)
+            chunk_weight += w
+        if chunk:
+            chunks.append((chunk_weight, chunk))
+
+        chunks.sort(key=lambda wc: -wc[0])
+        for _w, c in chunks:
+            yield c
+
+
+class PrefetchStats:
+    """
+    Backpressure of a pipeline of `prefetch_map`, that is, which of the two stages has been waiting for the other.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.consumer_waits = 0  # times the consumer waited for an item not yet done by the producers
+        self.consumer_wait_time = 0.0  # seconds
+        self.producer_stalls = 0  # times all of the prefetched items were done, i.e., the producers were idle
+
+    def add(self, other: "PrefetchStats") -> None:
+        self.items += other.items
+        self.consumer_waits += other.consumer_waits
+        self.consumer_wait_time += other.consumer_wait_time
+        self.producer_stalls += other.producer_stalls
+
+
+def prefetch_map(
+    func: Callable[[T], U],
+    it: Iterable[T],
+    workers: int,
+    max_pending: int,
+    stats: Optional[PrefetchStats] = None,
+) -> Iterator[Tuple[T, "Future[U]"]]:
+    """
+    Applies `func` to the items with a pool of `workers` threads, prefetching up to `max_pending` items ahead of
+    the consumer, and yields each item with its future, which is done, in the order of the items.
+    An exception raised by `func` is raised by `Future.result()`, in the consumer.
+    """
+    assert workers >= 1
+    assert max_pending >= 1
+    if stats is None:
+        stats = PrefetchStats()
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending: Deque[Tuple[T, "Future[U]"]] = deque()
+    try:
+        items = iter(it)
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= max_pending:
+                break  # for item
+
+        while pending:
+            if len(pending) >= max_pending and pending[-1][1].done():
+                stats.producer_stalls += 1
+            item, fut = pending.popleft()
+            if not fut.done():
+                stats.consumer_waits += 1
+                t = time()
+                fut.exception()  # wait for it
+                stats.consumer_wait_time += time() - t
+            for next_item in items:  # refill, before the consumer works on the item
+                pending.append((next_item, executor.submit(func, next_item)))
+                break  # for next_item
+            stats.items += 1
+            yield item, fut
+    finally:
+        for _item, fut in pending:
+            fut.cancel()
+        executor.shutdown(wait=True)
 
 
 def sliding_window_iter(range_length: int, window: int) -> Iterator[Tuple[int, int]]:
@@ -85,3 +195,43 @@ def sliding_window_iter(range_length: int, window: int) -> Iterator[Tuple[int, i
         for pos in range(0, range_length - (window - window // 2), window // 2):
             end_pos = min(pos + window, range_length)
             yield pos, end_pos
+
+
+def rolling_window_iter(blocks: Iterable[List[T]], window: int) -> Iterator[Tuple[int, List[T], List[Tuple[int, int]]]]:
+    """
+    Makes the same windows as `sliding_window_iter` over the concatenation of the blocks, without holding all of
+    the blocks at once. Yields a buffer at a time, as the index of the first item of the buffer, the buffer, and
+    the windows in the buffer (as positions in the buffer). Each window is yielded once.
+    The buffer holds the items of a block and the items of the windows not yet yielded, not all of the items.
+    """
+    step = window // 2 if window > 1 else 1
+    buf: List[T] = []
+    base = 0  # index of buf[0]
+    p = 0  # beginning of the next window
+    yielded = False
+    for block in blocks:
+        buf.extend(block)
+        end = base + len(buf)
+        poss = []
+        while p + window <= end:
+            poss.append((p - base, p - base + window))
+            p += step
+        if poss:
+            yield base, buf, poss
+            yielded = True
+            buf = buf[p - base :]
+            base = p
+
+    # the windows at the end, the size of which is known now
+    range_length = base + len(buf)
+    poss = []
+    if window == 1:
+        pass  # all windows have been yielded
+    elif not yielded and range_length <= window:
+        poss.append((0, range_length))
+    else:
+        while p < range_length - (window - window // 2):
+            poss.append((p - base, min(p + window, range_length) - base))
+            p += step
+    if poss:
+        yield base, buf, poss
@@ -0,0 +1,52 @@
+from typing import Optional, Tuple
+
+from collections import OrderedDict
+
+
+# a rough estimate of the memory used by an entry, in addition to the characters of the line and the word ids
+_ENTRY_OVERHEAD_BYTES = 200
+_WORD_ID_BYTES = 36
+
+
+class LineWordIdCache:
+    """
+    LRU cache from the content of a line to the word ids of it, so that a line that appears repeatedly
+    (a line in overlapping windows, a paragraph to be excerpted, or a boilerplate line such as a header or
+    a license notice in many documents) is tokenized only once.
+
+    The memory used by the entries is estimated and capped by `max_bytes`. The word ids depend on the
+    vocabulary of the model (which is pruned for a query), so the cache has to be cleared when it changes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, line: str) -> Optional[Tuple[int, ...]]:
+        ids = self._entries.get(line)
+        if ids is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(line)
+        self.hits += 1
+        return ids
+
+    def put(self, line: str, ids: Tuple[int, ...]) -> None:
+        size = _ENTRY_OVERHEAD_BYTES + len(line) + _WORD_ID_BYTES * len(ids)
+        if size > self.max_bytes or line in self._entries:
+            return
+        self._entries[line] = ids
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            L, old_ids = self._entries.popitem(last=False)
+            self._bytes -= _ENTRY_OVERHEAD_BYTES + len(L) + _WORD_ID_BYTES * len(old_ids)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
@@ -1,6 +1,7 @@
-from typing import Callable, Iterable, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from glob import glob
+import copy
 import hashlib
 import os
 import sys
@@ -8,14 +9,30 @@ import tarfile
 from typing import NamedTuple
 import urllib.request
 
+import numpy as np
 import toml
 
-from .scdv_embedding import Vec, read_scdv_embedding
+from .line_cache import LineWordIdCache
+from .native_model import NATIVE_MODEL_SUFFIX, prepare_native_model, read_native_scdv_embedding
+from .scdv_embedding import (
+    LinesWordIds,
+    QueryScorer,
+    SCDVEmbedding,
+    Vec,
+    read_scdv_embedding,
+    to_lines_word_ids,
+    vocab_remap,
+    window_word_counts,
+    windows_having_words,
+)
+from .tokenizers import make_en_tokenizer, make_ja_tokenizer
 from .scdv_embedding import inner_product_n  # DO NOT remove this. re-exporting it
 
 
 _script_dir = os.path.dirname(os.path.realpath(__file__))
 
+_WORD_ID_MEMO_MAX = 0x100000
+
 
 class ModelUrl(NamedTuple):
     name: str
@@ -96,15 +113,27 @@ def do_find_model_spec(model_name: str, model_dir: Optional[str] = None) -> Mode
     if spec is None or spec.version != url.version:
         sys.exit("Error: (internal) model installation corrupted.")
 
-    return spec
+    return use_native_model(spec)
+
+
+def use_native_model(spec: ModelSpec) -> ModelSpec:
+    """
+    Returns the spec of which model file is replaced with the native (memory-mappable) one,
+    converting the model file at the first use.
+    """
+    if spec.file_path.endswith(NATIVE_MODEL_SUFFIX):
+        return spec
+    try:
+        native_file = prepare_native_model(spec.file_path)
+    except OSError as e:
+        print("[Warning] failed to convert the model file, load it as it is: %s" % e, file=sys.stderr, flush=True)
+        return spec
+    return spec._replace(file_path=native_file)
 
 
 def load_tokenize_func(lang: Optional[str]) -> Callable[[str], Iterable[str]]:
     if lang == "ja":
-        import transformers
-
-        tokenizer = transformers.MecabTokenizer(do_lower_case=True)
-        return tokenizer.tokenize
+        return make_ja_tokenizer()
     elif lang == "en":
         import nltk
 
@@ -113,17 +142,29 @@ def load_tokenize_func(lang: Optional[str]) -> Callable[[str], Iterable[str]]:
         except LookupError:
             nltk.download("punkt")
 
-        return nltk.word_tokenize
+        return make_en_tokenizer()
     else:
         assert False, 'lang is not either "en" or "ja"'
 
 
 class SCDVModel:
-    def __init__(self, tokenizer_name: str, model_file: str):
+    def __init__(self, tokenizer_name: str, model_file: Optional[str] = None, embedder: Optional[SCDVEmbedding] = None):
+        assert (model_file is None) != (embedder is None), "specify either model_file or embedder"
         self.tokenizer_name = tokenizer_name
         self.tokenizer = None
-        self.embedder = read_scdv_embedding(model_file)
+        if embedder is None:
+            if model_file.endswith(NATIVE_MODEL_SUFFIX):
+                embedder = read_native_scdv_embedding(model_file)
+            else:
+                embedder = read_scdv_embedding(model_file)
+        self.embedder = embedder
         self.query_vec = None
+        self.scorer = None
+        self.word_id_memo: Dict[str, Optional[int]] = dict()
+        self.line_cache: Optional[LineWordIdCache] = None
+        self.query_models: List["SCDVModel"] = []
+        self._query_remaps: List[np.ndarray] = []
+        self._queries_positive_words: Optional[np.ndarray] = None
 
     def find_oov_tokens(self, line: str) -> List[str]:
         if self.tokenizer is None:
@@ -135,23 +176,156 @@ class SCDVModel:
     def set_query(self, lines: List[str]) -> None:
         self._optimize_for_query_lines(lines)
         self.query_vec = self._query_to_vec(lines)
+        self.scorer = None
+        self.word_id_memo = dict()
+        if self.line_cache is not None:
+            self.line_cache.clear()
+
+    def set_queries(self, queries: List[List[str]]) -> None:
+        """
+        Sets multiple queries. Unlike `set_query`, the model itself is not optimized for the queries, but
+        a model optimized for each query is made as `query_models[i]`, so that documents are tokenized
+        once with this model and scored for all the queries with `similarities_to_windows_of_queries`.
+        """
+        if self.tokenizer is None:
+            self.tokenizer = load_tokenize_func(self.tokenizer_name)
+        query_models = []
+        for lines in queries:
+            pruning = self.embedder.pruning_for_query_vec(self._query_to_vec(lines))
+            emb = copy.copy(self.embedder)
+            emb.prune(pruning)
+            m = SCDVModel(self.tokenizer_name, embedder=emb)
+            m.query_vec = emb.embed(self.tokenizer("\n".join(lines)))
+            query_models.append(m)
+        self.set_query_models(query_models)
+
+    def set_query_models(self, query_models: List["SCDVModel"], remaps: Optional[List[np.ndarray]] = None) -> None:
+        """
+        Sets multiple queries, each of which is given as a model optimized for the query, e.g., ones made by
+        `set_queries` in another process and placed on shared memory. `remaps[i]` maps the word ids of this model
+        to the ones of `query_models[i]` (see `vocab_remap`).
+        """
+        for m in query_models:
+            m.tokenizer = self.tokenizer
+        self.query_models = query_models
+        if remaps is None:
+            vocab_size = self.embedder.cluster_idf_wvs.shape[0]
+            remaps = [vocab_remap(m.embedder, vocab_size) for m in query_models]
+        self._query_remaps = remaps
+        self._queries_positive_words = None
+
+    def similarities_to_windows_of_queries(
+        self, lw: LinesWordIds, windows: List[Tuple[int, int]], positive_only: bool = False
+    ) -> np.ndarray:
+        """
+        Calculates the similarities of windows to each query, from the word ids of this model (not optimized
+        for a query). Returns an array of shape (number of queries, number of windows).
+        With a single query set with `set_query`, this is the same as `similarities_to_windows` of one row.
+        """
+        if not self.query_models:
+            return self.similarities_to_windows(lw, windows, positive_only)[None, :]
+        ws = np.array(windows, dtype=np.int64).reshape(-1, 2)
+        win, ids, counts = window_word_counts(lw, ws, self.embedder.cluster_idf_wvs.shape[0])
+        sims = np.zeros((len(self.query_models), ws.shape[0]), dtype=np.float64)
+        for q, (m, remap) in enumerate(zip(self.query_models, self._query_remaps)):
+            qids = remap[ids]
+            k = qids >= 0  # words pruned for the query do not contribute to the similarity
+            sims[q] = m.get_scorer().similarities_of_counts(win[k], qids[k], counts[k], ws.shape[0], positive_only)
+        return sims
+
+    def positive_words(self) -> np.ndarray:
+        """
+        Returns a boolean array, indexed by the word ids of this model, of the words of positive scores for the query
+        (or for any of the queries set with `set_queries`). A text without these words has a similarity of zero or
+        below to the query.
+        """
+        if not self.query_models:
+            return self.get_scorer().positive_words
+        if self._queries_positive_words is None:
+            mask = np.zeros(self.embedder.cluster_idf_wvs.shape[0], dtype=bool)
+            for m, remap in zip(self.query_models, self._query_remaps):
+                k = remap >= 0
+                mask[k] |= m.get_scorer().positive_words[remap[k]]
+            self._queries_positive_words = mask
+        return self._queries_positive_words
+
+    def windows_to_score(self, lw: LinesWordIds, windows: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Returns the windows that contain a word of a positive score, i.e., the ones that may have positive
+        similarities. The words of a document are checked at once, so a document without these words is
+        dropped without scoring any of its windows.
+        """
+        if not windows or not np.any(self.positive_words()[lw.ids]):
+            return []
+        ws = np.array(windows, dtype=np.int64).reshape(-1, 2)
+        having = windows_having_words(lw, ws, self.positive_words())
+        return [pos for pos, h in zip(windows, having.tolist()) if h]
 
     def get_query_vec(self) -> Optional[Vec]:
         return self.query_vec
 
-    def similarity_to_lines(self, lines: List[str]) -> float:
-        assert self.query_vec is not None, "call set_query() before similarity_to_lines()"
-        dv = self._lines_to_vec(lines)
-        return inner_product_n(dv, self.query_vec)
-
-    def _query_to_vec(self, lines: List[str]) -> Vec:
+    def get_scorer(self) -> QueryScorer:
+        assert self.query_vec is not None, "call set_query() before get_scorer()"
+        if self.scorer is None:
+            self.scorer = QueryScorer(self.embedder, self.query_vec)
+        return self.scorer
+
+    def lines_to_word_ids(self, lines: List[str]) -> LinesWordIds:
+        """
+        Tokenizes each line, and returns the ids of the in-vocabulary words of the lines.
+        With `line_cache`, a line tokenized before is looked up in the cache instead of being tokenized again.
+        """
         if self.tokenizer is None:
             self.tokenizer = load_tokenize_func(self.tokenizer_name)
-        words = self.tokenizer("\n".join(lines))
-        vec = self.embedder.embed(words)  # unit vector
-        return vec
+        tokenizer = self.tokenizer
+        w2i = self.embedder.word_to_index
+        if isinstance(w2i, dict):
+
+            def word_ids_of(L: str) -> Tuple[int, ...]:
+                ids = [w2i.get(w, None) for w in tokenizer(L)]
+                return tuple(i for i in ids if i is not None)
+
+        else:
+            # a lookup of a StringTable is several times slower than the one of a dict, so memoize the words
+            if len(self.word_id_memo) > _WORD_ID_MEMO_MAX:
+                self.word_id_memo.clear()
+            memo = self.word_id_memo
+
+            def word_ids_of(L: str) -> Tuple[int, ...]:
+                ids = []
+                for w in tokenizer(L):
+                    i = memo.get(w, -1)
+                    if i == -1:
+                        i = memo[w] = w2i.get(w, None)
+                    if i is not None:
+                        ids.append(i)
+                return tuple(ids)
+
+        cache = self.line_cache
+        if cache is None:
+            return to_lines_word_ids(word_ids_of(L) for L in lines)
+
+        word_id_lists = []
+        for L in lines:
+            ids = cache.get(L)
+            if ids is None:
+                ids = word_ids_of(L)
+                cache.put(L, ids)
+            word_id_lists.append(ids)
+        return to_lines_word_ids(word_id_lists)
+
+    def similarities_to_windows(
+        self, lw: LinesWordIds, windows: List[Tuple[int, int]], positive_only: bool = False
+    ) -> np.ndarray:
+        return self.get_scorer().similarities(lw, np.array(windows, dtype=np.int64).reshape(-1, 2), positive_only)
+
+    def similarities_to_line_ranges(self, lines: List[str], ranges: List[Tuple[int, int]]) -> np.ndarray:
+        return self.similarities_to_windows(self.lines_to_word_ids(lines), ranges)
+
+    def similarity_to_lines(self, lines: List[str]) -> float:
+        return float(self.similarities_to_line_ranges(lines, [(0, len(lines))])[0])
 
-    def _lines_to_vec(self, lines: List[str]) -> Vec:
+    def _query_to_vec(self, lines: List[str]) -> Vec:
         if self.tokenizer is None:
             self.tokenizer = load_tokenize_func(self.tokenizer_name)
         words = self.tokenizer("\n".join(lines))
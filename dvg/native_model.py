@@ -0,0 +1,114 @@
+from typing import Optional
+
+import json
+import os
+import pickle
+import shutil
+import uuid
+
+import numpy as np
+
+from .scdv_embedding import SCDVEmbedding, make_scdv_embedding
+from .string_table import StringTable, build_string_table
+
+
+NATIVE_MODEL_FORMAT_VERSION = 1
+
+# a model in the native format is a directory of .npy files, which are opened as memory-mapped arrays
+NATIVE_MODEL_SUFFIX = ".mmap"
+
+_META_FILE = "meta.json"
+_VOCAB_ARRAYS = ["blob", "offsets", "values", "slots"]
+
+
+def native_model_dir_of(pkl_file: str) -> str:
+    return os.path.splitext(pkl_file)[0] + NATIVE_MODEL_SUFFIX
+
+
+def _read_meta(native_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(native_dir, _META_FILE), "r", encoding="utf-8") as inp:
+            return json.load(inp)
+    except (OSError, ValueError):
+        return None
+
+
+def is_native_model_up_to_date(pkl_file: str, native_dir: str) -> bool:
+    meta = _read_meta(native_dir)
+    if meta is None or meta.get("format_version") != NATIVE_MODEL_FORMAT_VERSION:
+        return False
+    st = os.stat(pkl_file)
+    return (meta["source_size"], meta["source_mtime_ns"]) == (st.st_size, st.st_mtime_ns)
+
+
+def convert_to_native_model(pkl_file: str, native_dir: str) -> None:
+    """
+    Converts a model file (.pkl) into the native format. The conversion is done in a temporary directory,
+    which is renamed at the end, so that other processes never see a partially written model.
+    """
+    st = os.stat(pkl_file)
+    with open(pkl_file, "rb") as inp:
+        data = pickle.load(inp)
+    words = data["words"]
+    clusters = data["clusters"]
+    idf_wvs = data["idf_wvs"]
+
+    temp_dir = "%s.%s.tmp" % (native_dir, uuid.uuid4().hex)
+    os.makedirs(temp_dir)
+    try:
+        cluster_idf_wvs = np.concatenate((clusters, idf_wvs), axis=1)
+        np.save(os.path.join(temp_dir, "cluster_idf_wvs.npy"), cluster_idf_wvs)
+        del cluster_idf_wvs
+
+        table = build_string_table(dict((w, i) for i, w in enumerate(words)))
+        for name, a in table.arrays().items():
+            np.save(os.path.join(temp_dir, "vocab_%s.npy" % name), a)
+
+        meta = {
+            "format_version": NATIVE_MODEL_FORMAT_VERSION,
+            "source_size": st.st_size,
+            "source_mtime_ns": st.st_mtime_ns,
+            "m_shape": [clusters[0].size, idf_wvs[0].size],
+        }
+        with open(os.path.join(temp_dir, _META_FILE), "w", encoding="utf-8") as outp:
+            json.dump(meta, outp)
+
+        if os.path.exists(native_dir):  # an outdated one
+            shutil.rmtree(native_dir, ignore_errors=True)
+        try:
+            os.rename(temp_dir, native_dir)
+        except OSError:
+            if not is_native_model_up_to_date(pkl_file, native_dir):
+                raise
+            # another process has converted the same model file concurrently
+    finally:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def prepare_native_model(pkl_file: str) -> str:
+    """
+    Returns the native model of a model file, converting the model file if needed.
+    """
+    native_dir = native_model_dir_of(pkl_file)
+    if not is_native_model_up_to_date(pkl_file, native_dir):
+        convert_to_native_model(pkl_file, native_dir)
+    return native_dir
+
+
+def _load_array(native_dir: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(native_dir, name + ".npy"), mmap_mode="r")
+
+
+def read_native_scdv_embedding(native_dir: str) -> SCDVEmbedding:
+    """
+    Opens a model in the native format. The arrays are memory-mapped (read only), that is, the model is
+    loaded lazily page by page and processes that open the same model share the pages in the page cache.
+    """
+    meta = _read_meta(native_dir)
+    if meta is None or meta.get("format_version") != NATIVE_MODEL_FORMAT_VERSION:
+        raise ValueError("unsupported format of model: %s" % native_dir)
+    cluster_idf_wvs = _load_array(native_dir, "cluster_idf_wvs")
+    table = StringTable(**dict((name, _load_array(native_dir, "vocab_" + name)) for name in _VOCAB_ARRAYS))
+    m_shape = tuple(meta["m_shape"])
+    return make_scdv_embedding(table, cluster_idf_wvs, (m_shape[0], m_shape[1]))
@@ -1,15 +1,20 @@
-from typing import Generator, List, Optional, TextIO
+from typing import Generator, Iterator, List, Optional, TextIO, Tuple
 
 from contextlib import contextmanager
 import os
 import platform
 import re
+import shutil
 import subprocess
+import tempfile
 import unicodedata
 import uuid
 
+from .extraction_cache import ExtractionCache
+
 
 _script_dir: str = os.path.dirname(os.path.realpath(__file__))
+_system_temp_dir: str = tempfile.gettempdir()
 
 
 def to_lines(text: str) -> List[str]:
@@ -56,8 +61,60 @@ class ScanErrorNotFile(ScanError):
     pass
 
 
+# files of these extensions are costly to extract text from, and the extracted text is cached
+CACHED_EXTENSIONS = [".html", ".pdf", ".docx"]
+
+
+# a plain text file of this size or larger is read block by block in bounded memory, instead of at once
+STREAMING_SCAN_BYTES = 64 * 1024 * 1024
+_STREAMING_BLOCK_CHARS = 4 * 1024 * 1024
+
+
 class Scanner:
+    def __init__(self, cache: Optional[ExtractionCache] = None, pdf_parts: int = 1):
+        self.cache = cache
+        self.pdf_parts = pdf_parts  # max number of processes to extract a large PDF file with, see `pdf_parts_for`
+
+    def is_streamed(self, file_name: str) -> bool:
+        """
+        Returns whether the file should be read with `scan_blocks`, instead of `scan`.
+        """
+        if _ja_nkf_abspath:
+            return False
+        extension = os.path.splitext(file_name)[1].lower()
+        if not extension or extension in CACHED_EXTENSIONS or extension == ".htm":
+            return False
+        try:
+            return os.path.getsize(file_name) >= STREAMING_SCAN_BYTES
+        except OSError:
+            return False
+
+    def scan_blocks(self, file_name: str) -> Iterator[List[str]]:
+        """
+        Reads a plain text file block by block, and yields the lines of each block. The concatenation of the blocks
+        is the same as the lines returned by `scan`.
+        """
+        try:
+            with open_file(file_name) as inp:
+                while True:
+                    physical_lines = inp.readlines(_STREAMING_BLOCK_CHARS)
+                    if not physical_lines:
+                        break  # while True
+                    yield to_lines("".join(physical_lines))
+        except FileNotFoundError as e:
+            raise e
+        except OSError as e:
+            raise ScanError("ScanError: in reading file: %s" % repr(file_name)) from e
+
     def scan(self, file_name: str) -> List[str]:
+        cache = self.cache
+        if cache is not None and os.path.splitext(file_name)[1].lower() not in CACHED_EXTENSIONS:
+            cache = None
+        if cache is not None:
+            lines = cache.get(file_name)
+            if lines is not None:
+                return lines
+
         try:
             text = self._scan_i(file_name)
         except FileNotFoundError as e:
@@ -66,7 +123,11 @@ class Scanner:
             raise e
         except Exception as e:
             raise ScanError("ScanError: in reading file: %s" % repr(file_name)) from e
-        return to_lines(text)
+        lines = to_lines(text)
+
+        if cache is not None:
+            cache.put(file_name, lines)
+        return lines
 
     def _scan_i(self, file_name: str) -> str:
         assert file_name != "-"
@@ -85,16 +146,78 @@ class Scanner:
         if extension in [".html", "htm"]:
             return html_scan(file_name)
         elif extension == ".pdf":
-            return pdf_scan(file_name)
+            return pdf_scan(file_name, self.pdf_parts)
         elif extension == ".docx":
             return docx_scan(file_name)
         else:
             return read_text_file(file_name)
 
 
+# a PDF file of this number of pages or more is extracted in parallel, split into page ranges
+PDF_PARALLEL_PAGES = 200
+_PDF_MIN_PAGES_OF_PART = 100
+
+
+def pdf_page_ranges(page_count: int, max_parts: int) -> List[Tuple[int, int]]:
+    """
+    Splits the pages (0-origin, end exclusive) into ranges of almost the same number of pages, to be extracted
+    in parallel.
+    """
+    if page_count < PDF_PARALLEL_PAGES:
+        return [(0, page_count)]
+    parts = max(1, min(max_parts, page_count // _PDF_MIN_PAGES_OF_PART))
+    bounds = [page_count * i // parts for i in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def pdf_parts_for(workers: Optional[int]) -> int:
+    """
+    Returns the number of processes to extract a large PDF file with, in each of the worker processes,
+    so that the processes of all workers do not exceed the CPU cores.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers or 1))
+
+
+def pdftotext_page_ranges(command: str, file_name: str, ranges: List[Tuple[int, int]]) -> str:
+    """
+    Extracts the text of the page ranges (0-origin, end exclusive) of a PDF file with pdftotext commands
+    (of poppler-utils) running in parallel, and joins them in the page order. A range `(0, 0)` means all pages.
+    Each command writes to its own temporary file, so that no command waits for the others to be read.
+    """
+    tempfs = [os.path.join(_system_temp_dir, "%s.txt" % str(uuid.uuid4())) for _ in ranges]
+    ps: List[subprocess.Popen] = []
+    try:
+        for (b, e), tempf in zip(ranges, tempfs):
+            cmd = [command, "-enc", "UTF-8", file_name, tempf]
+            if e > 0:
+                cmd[1:1] = ["-f", str(b + 1), "-l", str(e)]
+            try:
+                ps.append(subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+            except FileNotFoundError:
+                raise ScanError("Error: pdftotext is not installed.")
+        texts = []
+        for p, tempf in zip(ps, tempfs):
+            out, err = p.communicate()
+            if p.returncode != 0:
+                raise ScanError(
+                    "ScanError: %s, file: %s, (%s)" % (err.decode("utf-8", "replace").rstrip(), repr(file_name), out)
+                )
+            with open_file(tempf) as f:
+                texts.append(f.read())
+        return "".join(texts)
+    finally:
+        for p in ps:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        for tempf in tempfs:
+            if os.path.exists(tempf):
+                os.remove(tempf)
+
+
 if platform.system() != "Windows":
 
-    def pdf_scan(file_name: str) -> str:
+    def pdf_scan(file_name: str, max_parts: int = 1) -> str:
         try:
             import pdftotext
         except ImportError:
@@ -106,6 +229,15 @@ if platform.system() != "Windows":
         except pdftotext.Error as e:
             raise ScanError("ScanError: %s, file: %s" % (str(e), repr(file_name)))
 
+        # a large file is split into page ranges, which are extracted by pdftotext commands in parallel.
+        # all ranges of a split file are extracted by the command (not by this module), so that the text does not
+        # depend on the number of ranges. without the command, the file is not split.
+        command = shutil.which("pdftotext") if max_parts >= 2 else None
+        if command is not None:
+            ranges = pdf_page_ranges(len(pdf), max_parts)
+            if len(ranges) >= 2:
+                return pdftotext_page_ranges(command, file_name, ranges)
+
         page_texts = [page for page in pdf]
         text = "".join(page_texts)
         # text = re.sub(r'(cid:\d+)', '', text)  # remove unknown glyphs
@@ -113,28 +245,19 @@ if platform.system() != "Windows":
         return text
 
 else:
-    import tempfile
 
-    _system_temp_dir = tempfile.gettempdir()
-
-    def pdf_scan(file_name: str) -> str:
-        tempf = os.path.join(_system_temp_dir, "%s.txt" % str(uuid.uuid4()))
+    def _pdf_page_count(file_name: str) -> Optional[int]:
         try:
-            cmd = ["pdftotext.exe", file_name, tempf]
-            p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            p = subprocess.run(["pdfinfo.exe", file_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         except FileNotFoundError:
-            raise ScanError("Error: pdftotext is not installed.")
-        else:
-            if p.returncode != 0:
-                raise ScanError(
-                    "ScanError: %s, file: %s, (%s)" % (p.stderr.decode("utf-8").rstrip(), repr(file_name), p.stdout)
-                )
-            with open_file(tempf) as f:
-                text = f.read()
-            return text
-        finally:
-            if os.path.exists(tempf):
-                os.remove(tempf)
+            return None  # pdfinfo is not installed. the file is extracted without being split.
+        m = re.search(rb"^Pages:\s*(\d+)", p.stdout, re.MULTILINE)
+        return int(m.group(1)) if p.returncode == 0 and m else None
+
+    def pdf_scan(file_name: str, max_parts: int = 1) -> str:
+        page_count = _pdf_page_count(file_name) if max_parts >= 2 else None
+        ranges = pdf_page_ranges(page_count, max_parts) if page_count is not None else [(0, 0)]
+        return pdftotext_page_ranges("pdftotext.exe", file_name, ranges)
 
 
 def html_scan(file_name: str) -> str:
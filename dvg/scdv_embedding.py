@@ -1,4 +1,4 @@
-from typing import Iterable, List
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
 
 from collections import Counter
 import pickle
@@ -8,6 +8,8 @@ import numpy as np
 import numpy.typing as npt
 from numpy.linalg import norm
 
+from .string_table import StringTable
+
 
 Vec = npt.NDArray
 
@@ -23,15 +25,25 @@ def sparse(v: Vec) -> Vec:
     return v
 
 
+_OPTIMIZE_BATCH_ROWS = 0x10000
+_SIMILARITIES_BUDGET_FLOATS = 0x200000
+
+
 class QueryVecError(ValueError):
     pass
 
 
 class SCDVEmbedding:
+    word_to_index: Union[Dict[str, int], StringTable]
+    cluster_idf_wvs: np.ndarray
+    m_shape: Tuple[int, int]
+    orig_word_indices: Optional[np.ndarray]  # indices of words in the model file. None means not pruned
+
     def __init__(self, words: List[str], clusters: np.ndarray, idf_wvs: np.ndarray):
         self.word_to_index = dict((w, i) for i, w in enumerate(words))
         self.cluster_idf_wvs = np.concatenate((clusters, idf_wvs), axis=1)
         self.m_shape = (clusters[0].size, idf_wvs[0].size)
+        self.orig_word_indices = None
 
     def embed(self, words: Iterable[str]) -> Vec:
         wf = Counter(words)
@@ -58,6 +70,12 @@ class SCDVEmbedding:
         return v
 
     def optimize_for_query_vec(self, query_vec: Vec):
+        self.prune(self.pruning_for_query_vec(query_vec))
+
+    def pruning_for_query_vec(self, query_vec: Vec) -> "Pruning":
+        """
+        Finds the words and the cluster items that have (almost) zero-weight for the query.
+        """
         assert query_vec.size == self.m_shape[0] * self.m_shape[1]
 
         query_vec = sparse(query_vec)
@@ -65,44 +83,219 @@ class SCDVEmbedding:
             raise QueryVecError("query vector does not contain any topics in the model")
 
         # remove words with zero-weight
-        idx_words = sorted((i, w) for w, i in self.word_to_index.items())
-        discarded_indices = []
-        w2i = dict()
-        ci = 0
-        for i, w in idx_words:
-            vec = self.embed([w])
-            sim = inner_product_n(vec, query_vec)
-            if abs(sim) < 0.001:
-                discarded_indices.append(i)
-            else:
-                w2i[w] = ci
-                ci += 1
-
-        if ci == 0:  # prevent all words being removed
-            keep_i_w = idx_words[0]
-            discarded_indices = [i for i, w in idx_words[1:]]
-            w2i[keep_i_w[1]] = keep_i_w[0]
-            ci = 1
-
-        assert ci + len(discarded_indices) == len(idx_words)
+        # the similarity of each word to the query, i.e., `inner_product_n(self.embed([w]), query_vec)`, is
+        # calculated for all words at once, as `c^T Q u / (|c| |u|)` where the word's vector is
+        # `outer(c, u)` and Q is the query vector reshaped into a matrix.
+        cluster_size = self.m_shape[0]
+        query_mat = query_vec.reshape(self.m_shape)
+        vocab_size = self.cluster_idf_wvs.shape[0]
+        sims = np.empty(vocab_size, dtype=np.float32)
+        for b in range(0, vocab_size, _OPTIMIZE_BATCH_ROWS):
+            cvs = self.cluster_idf_wvs[b : b + _OPTIMIZE_BATCH_ROWS]
+            cs, us = cvs[:, :cluster_size], cvs[:, cluster_size:]
+            ips = np.einsum("ij,ij->i", cs @ query_mat, us)
+            ns = norm(cs, axis=1) * norm(us, axis=1)
+            sims[b : b + cvs.shape[0]] = np.divide(ips, ns, out=np.zeros_like(ips), where=ns != 0.0)
+
+        keep = np.abs(sims) >= 0.001
+        if not np.any(keep):  # prevent all words being removed
+            keep[0] = True
+
+        # remove cluster items with zero-weight
+        keep_cluster_items = norm(query_mat, axis=1) >= 0.001
+        if not np.any(keep_cluster_items):  # prevent all cluster items being discarded
+            keep_cluster_items[-1] = True
+
+        return Pruning(np.flatnonzero(keep), np.flatnonzero(keep_cluster_items))
+
+    def prune(self, pruning: "Pruning") -> None:
+        cluster_size, len_idf_wvs = self.m_shape
+        keep = np.zeros(self.cluster_idf_wvs.shape[0], dtype=bool)
+        keep[pruning.word_indices] = True
+
+        new_indices = np.cumsum(keep) - 1
+        if isinstance(self.word_to_index, StringTable):
+            # the table (e.g., memory-mapped from a model file) is not rebuilt, but only its values are replaced
+            w2i = self.word_to_index.remap_values(np.where(keep, new_indices, -1))
+        else:
+            w2i = dict((w, int(new_indices[i])) for w, i in self.word_to_index.items() if keep[i])
 
         self.word_to_index = w2i
-        self.cluster_idf_wvs = np.delete(self.cluster_idf_wvs, discarded_indices, axis=0)
+        columns = np.concatenate((pruning.cluster_items, np.arange(cluster_size, cluster_size + len_idf_wvs)))
+        self.cluster_idf_wvs = self.cluster_idf_wvs[np.ix_(pruning.word_indices, columns)]
+        kept_indices = pruning.word_indices
+        if self.orig_word_indices is not None:
+            kept_indices = self.orig_word_indices[kept_indices]
+        self.orig_word_indices = kept_indices
         assert self.cluster_idf_wvs.shape[0] == len(self.word_to_index)
 
-        # remove cluster items with zero-weight
-        discarded_cluster_items = []
-        len_idf_wvs = self.m_shape[1]
-        cluster_size = self.m_shape[0]
-        for i in range(cluster_size):
-            if norm(query_vec[i * len_idf_wvs : (i + 1) * len_idf_wvs]) < 0.001:
-                discarded_cluster_items.append(i)
+        self.m_shape = (pruning.cluster_items.size, len_idf_wvs)
+
+
+class Pruning(NamedTuple):
+    """
+    Words and cluster items of an embedding to be kept, for a query.
+    """
+
+    word_indices: np.ndarray
+    cluster_items: np.ndarray
+
+
+def vocab_remap(emb: SCDVEmbedding, vocab_size: int) -> np.ndarray:
+    """
+    Returns a map from the word ids of the model file to the ones of the (pruned) embedding.
+    Words removed from the embedding are mapped to -1.
+    """
+    remap = np.full(vocab_size, -1, dtype=np.int64)
+    if emb.orig_word_indices is None:
+        remap[: emb.cluster_idf_wvs.shape[0]] = np.arange(emb.cluster_idf_wvs.shape[0])
+    else:
+        remap[emb.orig_word_indices] = np.arange(emb.orig_word_indices.size)
+    return remap
+
+
+class LinesWordIds(NamedTuple):
+    """
+    Word ids of lines. The ids of the i-th line are `ids[offsets[i] : offsets[i + 1]]`.
+    """
+
+    ids: np.ndarray
+    offsets: np.ndarray
+
+
+def to_lines_word_ids(word_id_lists: Iterable[Iterable[int]]) -> LinesWordIds:
+    ids = []
+    lens = [0]
+    for wids in word_id_lists:
+        len_ids = len(ids)
+        ids.extend(wids)
+        lens.append(len(ids) - len_ids)
+    return LinesWordIds(np.array(ids, dtype=np.int64), np.cumsum(lens, dtype=np.int64))
+
+
+def windows_having_words(lw: LinesWordIds, windows: np.ndarray, word_mask: np.ndarray) -> np.ndarray:
+    """
+    Returns whether each window (a row of `windows`, a range of lines) contains any of the words of `word_mask`
+    (a boolean array indexed by word id).
+    """
+    counts = np.zeros(lw.ids.size + 1, dtype=np.int64)
+    np.cumsum(word_mask[lw.ids], out=counts[1:])
+    return counts[lw.offsets[windows[:, 1]]] > counts[lw.offsets[windows[:, 0]]]
+
+
+def window_word_counts(
+    lw: LinesWordIds, windows: np.ndarray, vocab_size: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds a sparse (window x vocabulary) matrix of word counts, in the coordinate format.
+    Returns the arrays of window indices, word ids, and counts, sorted by window index.
+    """
+    starts = lw.offsets[windows[:, 0]]
+    lens = lw.offsets[windows[:, 1]] - starts
+    total = int(lens.sum())
+    if total == 0:
+        e = np.zeros(0, dtype=np.int64)
+        return e, e, e
+
+    win = np.repeat(np.arange(windows.shape[0], dtype=np.int64), lens)
+    pos = np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(lens) - lens), lens)
+    keys, counts = np.unique(win * vocab_size + lw.ids[pos], return_counts=True)
+    return keys // vocab_size, keys % vocab_size, counts
+
+
+class QueryScorer:
+    """
+    Calculates the similarity between a bag of words and a fixed query vector, without materializing the
+    SCDV vector (the sum of outer products) of the bag of words.
+
+    For a bag of words whose SCDV vector is `v = sum_i f_i outer(c_i, u_i)`, and a query matrix Q,
+    the numerator of the similarity `<v, Q>` is `sum_i f_i s_i` with the per-word score `s_i = c_i^T Q u_i`,
+    and the squared norm `|v|^2` is `sum_{i,j} f_i f_j (c_i . c_j) (u_i . u_j)`.
+    """
+
+    def __init__(self, emb: SCDVEmbedding, query_vec: Vec):
+        cluster_size = emb.m_shape[0]
+        assert query_vec.size == emb.m_shape[0] * emb.m_shape[1]
+        query_mat = query_vec.reshape(emb.m_shape)
+        self.cs = emb.cluster_idf_wvs[:, :cluster_size]
+        self.us = emb.cluster_idf_wvs[:, cluster_size:]
+        self.word_scores = np.einsum("ij,ij->i", self.cs @ query_mat, self.us).astype(np.float32)
+
+        # a bag of words can have a positive similarity only when it contains any of these words
+        self.positive_words = self.word_scores > 0.0
+
+    def similarities(self, lw: LinesWordIds, windows: np.ndarray, positive_only: bool = False) -> np.ndarray:
+        """
+        Calculates the similarities of windows over lines at once.
+        `windows` is an array of shape (number of windows, 2), each row of which is a range of lines.
+        """
+        win, ids, counts = window_word_counts(lw, windows, self.word_scores.size)
+        return self.similarities_of_counts(win, ids, counts, windows.shape[0], positive_only)
+
+    def similarities_of_counts(
+        self, win: np.ndarray, ids: np.ndarray, counts: np.ndarray, window_count: int, positive_only: bool = False
+    ) -> np.ndarray:
+        """
+        Calculates the similarities of windows from a sparse (window x vocabulary) matrix of word counts
+        in the coordinate format. The entries should be sorted by window index and must not have duplicates.
+
+        With `positive_only`, the similarities of the windows that can not be positive (the numerator of which is
+        zero or negative) are given as zero, without calculating their norms, which is the most costly part.
+        """
+        sims = np.zeros(window_count, dtype=np.float64)
+        if win.size == 0:
+            return sims
+        freqs = counts.astype(np.float32)
+
+        numerators = np.bincount(win, weights=freqs * self.word_scores[ids], minlength=window_count)
+        if positive_only:
+            k = numerators[win] > 0.0
+            if not np.all(k):
+                win, ids, freqs = win[k], ids[k], freqs[k]
+                if win.size == 0:
+                    return sims
+
+        # the norm of each window's vector: sum of the outer products of the entries of the window,
+        # calculated for a group of windows at once with `reduceat`, within a budget of memory.
+        norm_sqs = np.zeros(window_count, dtype=np.float64)
+        nonempty_wins, entry_starts = np.unique(win, return_index=True)
+        entry_ends = np.append(entry_starts[1:], win.size)
+        cluster_size, len_idf_wvs = self.cs.shape[1], self.us.shape[1]
+        max_entries = max(1, _SIMILARITIES_BUDGET_FLOATS // (cluster_size * len_idf_wvs))
+        g = 0
+        while g < nonempty_wins.size:
+            gb = entry_starts[g]
+            h = int(np.searchsorted(entry_ends, gb + max_entries, side="right"))
+            if h == g:  # a large window. calculate the norm of it individually
+                es = slice(entry_starts[g], entry_ends[g])
+                m = (self.cs[ids[es]] * freqs[es, None]).T @ self.us[ids[es]]
+                norm_sqs[nonempty_wins[g]] = np.einsum("ij,ij->", m, m)
+                g += 1
+                continue  # while g
+            es = slice(gb, entry_ends[h - 1])
+            ps = (self.cs[ids[es]] * freqs[es, None])[:, :, None] * self.us[ids[es]][:, None, :]
+            ms = np.add.reduceat(ps, entry_starts[g:h] - gb, axis=0)
+            norm_sqs[nonempty_wins[g:h]] = np.einsum("ijk,ijk->i", ms, ms)
+            g = h
+
+        valid = (numerators != 0.0) & (norm_sqs > 0.0)
+        sims[valid] = numerators[valid] / np.sqrt(norm_sqs[valid])
+        return sims
 
-        if len(discarded_cluster_items) == cluster_size:  # prevent all cluster items being discarded
-            discarded_cluster_items.pop()
 
-        self.cluster_idf_wvs = np.delete(self.cluster_idf_wvs, discarded_cluster_items, axis=1)
-        self.m_shape = (cluster_size - len(discarded_cluster_items), len_idf_wvs)
+def make_scdv_embedding(
+    word_to_index: Union[Dict[str, int], StringTable], cluster_idf_wvs: np.ndarray, m_shape: Tuple[int, int]
+) -> SCDVEmbedding:
+    """
+    Builds an embedding from the arrays that have already been concatenated (and possibly pruned),
+    e.g., ones placed on shared memory.
+    """
+    emb = SCDVEmbedding.__new__(SCDVEmbedding)
+    emb.word_to_index = word_to_index
+    emb.cluster_idf_wvs = cluster_idf_wvs
+    emb.m_shape = m_shape
+    emb.orig_word_indices = None
+    return emb
 
 
 def read_scdv_embedding(wordtopicvec_pack_file: str) -> SCDVEmbedding:
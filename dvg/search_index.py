@@ -0,0 +1,257 @@
+from typing import List, NamedTuple, Optional, Tuple
+
+import json
+import os
+
+import numpy as np
+
+from .iter_funcs import sliding_window_iter
+from .models import SCDVModel, sha256sum_of_file
+from .scdv_embedding import vocab_remap, window_word_counts
+
+
+INDEX_FORMAT_VERSION = 2
+
+_META_FILE = "index.json"
+
+# data files are named with the generation of the index, so that an update of an index
+# can write new data files while the old ones are in use, and switch to them by replacing the meta file.
+_WINDOWS_FILE = "windows.%d.bin"
+_ENTRY_IDS_FILE = "entry_ids.%d.bin"
+_ENTRY_COUNTS_FILE = "entry_counts.%d.bin"
+_DATA_FILES = [_WINDOWS_FILE, _ENTRY_IDS_FILE, _ENTRY_COUNTS_FILE]
+
+# columns of the table of windows
+W_FILE, W_BEGIN, W_END, W_PARA_LEN, W_ENTRY_BEGIN, W_ENTRY_END = range(6)
+_WINDOW_COLUMNS = 6
+
+_SIMILARITIES_BLOCK_WINDOWS = 0x10000
+
+
+class SearchIndexError(Exception):
+    pass
+
+
+class IndexedFile(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str  # empty when the index is built without content hashes
+
+
+def indexed_file_of(path: str, content_hash: bool = False) -> IndexedFile:
+    st = os.stat(path)
+    return IndexedFile(path, st.st_size, st.st_mtime_ns, sha256sum_of_file(path) if content_hash else "")
+
+
+def is_file_unchanged(f: IndexedFile) -> Tuple[bool, IndexedFile]:
+    """
+    Checks if a file is the same as when it was indexed, by its size and mtime, or, when the file has
+    a content hash, by the hash. Returns the result and the up-to-date attributes of the file.
+    """
+    try:
+        cur = indexed_file_of(f.path)
+    except FileNotFoundError:
+        return False, f
+    if (cur.size, cur.mtime_ns) == (f.size, f.mtime_ns):
+        return True, f
+    if f.sha256 and cur.size == f.size:
+        cur = cur._replace(sha256=sha256sum_of_file(f.path))
+        return cur.sha256 == f.sha256, cur
+    return False, cur
+
+
+class DocumentIndexData(NamedTuple):
+    windows: np.ndarray  # rows of (begin, end, para_len)
+    win: np.ndarray  # sparse (window x vocabulary) matrix of word counts, in the coordinate format
+    ids: np.ndarray
+    counts: np.ndarray
+
+
+def index_document(lines: List[str], model: SCDVModel, window: int) -> DocumentIndexData:
+    """
+    Splits a document into windows and counts the words in each window.
+    The model should NOT be optimized for a query, so that word ids are the ones of the model file.
+    """
+    windows = np.array(list(sliding_window_iter(len(lines), window)), dtype=np.int64).reshape(-1, 2)
+    line_lens = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(L) for L in lines], out=line_lens[1:])
+    para_lens = line_lens[windows[:, 1]] - line_lens[windows[:, 0]]
+
+    lw = model.lines_to_word_ids(lines)
+    win, ids, counts = window_word_counts(lw, windows, model.embedder.cluster_idf_wvs.shape[0])
+    return DocumentIndexData(np.column_stack((windows, para_lens)), win, ids, counts)
+
+
+class SearchIndexWriter:
+    """
+    Writes an index of documents, which is a table of windows (file, line range, paragraph length) and
+    the word counts of each window. The word counts are independent from queries.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        model_name: str,
+        model_version: str,
+        vocab_size: int,
+        window: int,
+        content_hash: bool = False,
+        generation: int = 0,
+    ):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.model_version = model_version
+        self.vocab_size = vocab_size
+        self.window = window
+        self.content_hash = content_hash
+        self.generation = generation
+        self.files: List[IndexedFile] = []
+        self.window_count = 0
+        self.entry_count = 0
+        self._windows_out = open(os.path.join(index_dir, _WINDOWS_FILE % generation), "wb")
+        self._entry_ids_out = open(os.path.join(index_dir, _ENTRY_IDS_FILE % generation), "wb")
+        self._entry_counts_out = open(os.path.join(index_dir, _ENTRY_COUNTS_FILE % generation), "wb")
+
+    def add_document(self, f: IndexedFile, d: DocumentIndexData) -> None:
+        file_id = len(self.files)
+        self.files.append(f)
+
+        n = d.windows.shape[0]
+        rows = np.empty((n, _WINDOW_COLUMNS), dtype=np.int64)
+        rows[:, W_FILE] = file_id
+        rows[:, W_BEGIN : W_PARA_LEN + 1] = d.windows
+        entry_bounds = np.searchsorted(d.win, np.arange(n + 1)) + self.entry_count
+        rows[:, W_ENTRY_BEGIN] = entry_bounds[:-1]
+        rows[:, W_ENTRY_END] = entry_bounds[1:]
+
+        rows.tofile(self._windows_out)
+        d.ids.astype(np.int32).tofile(self._entry_ids_out)
+        d.counts.astype(np.int32).tofile(self._entry_counts_out)
+        self.window_count += n
+        self.entry_count += d.ids.size
+
+    def close(self) -> None:
+        for outp in [self._windows_out, self._entry_ids_out, self._entry_counts_out]:
+            outp.close()
+
+        meta = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "model": self.model_name,
+            "model_version": self.model_version,
+            "vocab_size": self.vocab_size,
+            "window": self.window,
+            "content_hash": self.content_hash,
+            "generation": self.generation,
+            "window_count": self.window_count,
+            "entry_count": self.entry_count,
+            "files": [list(f) for f in self.files],
+        }
+        meta_file = os.path.join(self.index_dir, _META_FILE)
+        with open(meta_file + ".tmp", "w", encoding="utf-8") as outp:
+            json.dump(meta, outp, ensure_ascii=False)
+        os.replace(meta_file + ".tmp", meta_file)
+
+        # remove the data files of the other generations, i.e., the ones before an update
+        for fn in os.listdir(self.index_dir):
+            for df in _DATA_FILES:
+                g = _generation_of_data_file(fn, df)
+                if g is not None and g != self.generation:
+                    os.remove(os.path.join(self.index_dir, fn))
+
+
+def _generation_of_data_file(file_name: str, data_file_pattern: str) -> Optional[int]:
+    prefix, suffix = data_file_pattern.split("%d")
+    if file_name.startswith(prefix) and file_name.endswith(suffix):
+        g = file_name[len(prefix) : len(file_name) - len(suffix)]
+        if g.isdigit():
+            return int(g)
+    return None
+
+
+def index_exists(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, _META_FILE))
+
+
+def _open_array(file_name: str, dtype, shape) -> np.ndarray:
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)  # np.memmap can not map an empty file
+    return np.memmap(file_name, dtype=dtype, mode="r", shape=shape)
+
+
+class SearchIndex:
+    def __init__(self, index_dir: str):
+        meta_file = os.path.join(index_dir, _META_FILE)
+        try:
+            with open(meta_file, "r", encoding="utf-8") as inp:
+                meta = json.load(inp)
+        except FileNotFoundError:
+            raise SearchIndexError("Error: index not found: %s" % index_dir)
+        if meta.get("format_version") != INDEX_FORMAT_VERSION:
+            raise SearchIndexError("Error: unsupported format of index (rebuild the index): %s" % index_dir)
+
+        self.index_dir = index_dir
+        self.model_name: str = meta["model"]
+        self.model_version: str = meta["model_version"]
+        self.vocab_size: int = meta["vocab_size"]
+        self.window: int = meta["window"]
+        self.content_hash: bool = meta["content_hash"]
+        self.generation: int = meta["generation"]
+        self.files = [IndexedFile(*f) for f in meta["files"]]
+
+        g = self.generation
+        window_count, entry_count = meta["window_count"], meta["entry_count"]
+        self.windows = _open_array(
+            os.path.join(index_dir, _WINDOWS_FILE % g), np.int64, (window_count, _WINDOW_COLUMNS)
+        )
+        self.entry_ids = _open_array(os.path.join(index_dir, _ENTRY_IDS_FILE % g), np.int32, (entry_count,))
+        self.entry_counts = _open_array(os.path.join(index_dir, _ENTRY_COUNTS_FILE % g), np.int32, (entry_count,))
+
+    def document_data(self, file_id: int) -> DocumentIndexData:
+        """
+        Returns the data of a file in the index, e.g., to copy it to the updated index.
+        """
+        file_col = self.windows[:, W_FILE]
+        wb, we = np.searchsorted(file_col, [file_id, file_id + 1])
+        ws = np.asarray(self.windows[wb:we])
+        if ws.shape[0] == 0:
+            e = np.zeros(0, dtype=np.int64)
+            return DocumentIndexData(np.zeros((0, 3), dtype=np.int64), e, e, e)
+        eb, ee = ws[0, W_ENTRY_BEGIN], ws[-1, W_ENTRY_END]
+        win = np.repeat(np.arange(ws.shape[0], dtype=np.int64), ws[:, W_ENTRY_END] - ws[:, W_ENTRY_BEGIN])
+        return DocumentIndexData(
+            ws[:, W_BEGIN : W_PARA_LEN + 1],
+            win,
+            np.asarray(self.entry_ids[eb:ee], dtype=np.int64),
+            np.asarray(self.entry_counts[eb:ee], dtype=np.int64),
+        )
+
+    def close(self) -> None:
+        # release the memory-mapped files (so that they can be removed on Windows)
+        self.windows = self.entry_ids = self.entry_counts = None
+
+    def similarities(self, model: SCDVModel, positive_only: bool = False) -> np.ndarray:
+        """
+        Calculates the similarity of every window in the index to the query of the model.
+        With `positive_only`, the windows (and so the documents) that can not have positive similarities are
+        given zero without calculating their norms (see `QueryScorer.similarities_of_counts`).
+        """
+        scorer = model.get_scorer()
+        remap = vocab_remap(model.embedder, self.vocab_size)
+
+        window_count = self.windows.shape[0]
+        sims = np.zeros(window_count, dtype=np.float64)
+        for wb in range(0, window_count, _SIMILARITIES_BLOCK_WINDOWS):
+            ws = np.asarray(self.windows[wb : wb + _SIMILARITIES_BLOCK_WINDOWS])
+            eb, ee = ws[0, W_ENTRY_BEGIN], ws[-1, W_ENTRY_END]
+            win = np.repeat(np.arange(ws.shape[0], dtype=np.int64), ws[:, W_ENTRY_END] - ws[:, W_ENTRY_BEGIN])
+            ids = remap[self.entry_ids[eb:ee]]
+            m = ids >= 0  # words pruned for the query do not contribute to the similarity
+            if positive_only and not np.any(scorer.positive_words[ids[m]]):
+                continue  # for wb
+            sims[wb : wb + ws.shape[0]] = scorer.similarities_of_counts(
+                win[m], ids[m], self.entry_counts[eb:ee][m], ws.shape[0], positive_only
+            )
+        return sims
+
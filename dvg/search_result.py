@@ -1,6 +1,12 @@
-from typing import Callable, List, Tuple
+from typing import BinaryIO, Callable, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
+import heapq
+import math
+import pickle
 import sys
+import tempfile
+
+import numpy as np
 
 from .iter_funcs import ranges_overwrapping
 
@@ -9,7 +15,8 @@ ANSI_ESCAPE_CLEAR_CUR_LINE = "\x1b[1K\n\x1b[1A"
 
 
 Pos = Tuple[int, int]
-SLPLD = Tuple[float, int, Pos, List[str], str]  # similarity, length, pos, lines, document file
+# similarity, length, pos, lines of the paragraph (None for a result found in an index), document file
+SLPLD = Tuple[float, int, Pos, Optional[List[str]], str]
 
 
 def prune_overlapped_paragraphs(slppds: List[SLPLD]) -> List[SLPLD]:
@@ -27,7 +34,11 @@ def prune_overlapped_paragraphs(slppds: List[SLPLD]) -> List[SLPLD]:
     return [ipsrls for i, ipsrls in enumerate(slppds) if i not in dropped_index_set]
 
 
-def excerpt_text(lines: List[str], similarity_to_lines: Callable[[List[str]], float], length_to_excerpt: int) -> str:
+def excerpt_text(
+    lines: List[str],
+    similarities_to_line_ranges: Callable[[List[str], List[Pos]], Sequence[float]],
+    length_to_excerpt: int,
+) -> str:
     if not lines:
         return ""
 
@@ -35,7 +46,7 @@ def excerpt_text(lines: List[str], similarity_to_lines: Callable[[List[str]], fl
         return lines[0][:length_to_excerpt]
 
     len_lines = len(lines)
-    max_sim_data = None
+    candidate_ranges: List[Pos] = []
     for p in range(len_lines):
         para_textlen = len(lines[p])
         if para_textlen == 0:
@@ -44,27 +55,130 @@ def excerpt_text(lines: List[str], similarity_to_lines: Callable[[List[str]], fl
         while q < len_lines and para_textlen < length_to_excerpt:
             para_textlen += len(lines[q])
             q += 1
-        sim = similarity_to_lines(lines[p:q])
-        if max_sim_data is None or sim > max_sim_data[0]:
-            max_sim_data = sim, (p, q)
+        candidate_ranges.append((p, q))
         if q == len_lines:
             break  # for p
-    assert max_sim_data is not None
+    assert candidate_ranges
 
-    b, e = max_sim_data[1]
+    # the similarities of all candidate ranges are calculated at once
+    sims = similarities_to_line_ranges(lines, candidate_ranges)
+    b, e = candidate_ranges[int(np.argmax(sims))]
     excerpt = "|".join(lines[b:e])
     excerpt = excerpt[:length_to_excerpt]
     return excerpt
 
 
+def _search_result_key(slpld: SLPLD) -> Tuple[float, int, Pos, str]:
+    return slpld[0], slpld[1], slpld[2], slpld[4]  # lines are not compared, which may be None
+
+
 def trim_search_results(search_results: List[SLPLD], top_k: int):
-    search_results.sort(reverse=True)
+    search_results.sort(key=_search_result_key, reverse=True)
     del search_results[top_k:]
 
 
-def print_intermediate_search_result(search_results: List[SLPLD], done_files: int, elapsed_time: float):
-    if search_results:
-        sim, para_len, pos, _para, df = search_results[0]
+_SPILL_RESULTS = 0x10000
+
+
+class TopKCollector:
+    """
+    Collects the top-k search results (in the order of `_search_result_key`) with a bounded min-heap.
+
+    With `top_k == 0`, all search results are collected. To keep memory usage flat, they are buffered,
+    and each time the buffer gets full, it is sorted and spilled to a temporary file as a run.
+    The runs are merged in `iter_results`.
+    """
+
+    def __init__(self, top_k: int, spill_results: int = _SPILL_RESULTS):
+        self.top_k = top_k
+        self.spill_results = spill_results
+        self._heap: List[Tuple[Tuple[float, int, Pos, str], int, SLPLD]] = []
+        self._count = 0  # a tie-breaker of heap items, so that the lines of results are never compared
+        self._runs: List[Tuple[BinaryIO, int]] = []  # temporary files and the numbers of results in them
+        self._best: Optional[Tuple[Tuple[float, int, Pos, str], SLPLD]] = None
+
+    def __len__(self) -> int:
+        return len(self._heap) + sum(c for _run, c in self._runs)
+
+    def is_full(self) -> bool:
+        return self.top_k > 0 and len(self._heap) >= self.top_k
+
+    def threshold(self) -> float:
+        """
+        Returns the similarity that a search result requires to be collected.
+        """
+        if not self.is_full():
+            return -math.inf
+        return self._heap[0][0][0]
+
+    def best(self) -> Optional[SLPLD]:
+        return self._best[1] if self._best is not None else None
+
+    def add(self, slpld: SLPLD) -> None:
+        item = (_search_result_key(slpld), self._count, slpld)
+        self._count += 1
+        if self._best is None or item[0] > self._best[0]:
+            self._best = (item[0], slpld)
+        if self.top_k == 0:
+            self._heap.append(item)  # not a heap, but a buffer
+            if len(self._heap) >= self.spill_results:
+                self._spill()
+        elif len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def extend(self, slplds: Iterable[SLPLD]) -> None:
+        for slpld in slplds:
+            self.add(slpld)
+
+    def _spill(self) -> None:
+        self._heap.sort(reverse=True)
+        run = tempfile.TemporaryFile()
+        for _key, _c, slpld in self._heap:
+            pickle.dump(slpld, run, protocol=pickle.HIGHEST_PROTOCOL)
+        self._runs.append((run, len(self._heap)))
+        self._heap = []
+
+    def iter_results(self) -> Iterator[SLPLD]:
+        """
+        Iterates the collected search results in descending order.
+        """
+        in_memory = [slpld for _key, _c, slpld in sorted(self._heap, reverse=True)]
+        if not self._runs:
+            yield from in_memory
+            return
+
+        def read_run(run: BinaryIO, count: int) -> Iterator[SLPLD]:
+            run.seek(0)
+            for _ in range(count):
+                yield pickle.load(run)
+
+        its = [read_run(run, c) for run, c in self._runs] + [iter(in_memory)]
+        yield from heapq.merge(*its, key=_search_result_key, reverse=True)
+
+    def results(self) -> List[SLPLD]:
+        return list(self.iter_results())
+
+    def close(self) -> None:
+        for run, _c in self._runs:
+            run.close()
+        self._runs = []
+
+
+def print_intermediate_progress(done_files: int, elapsed_time: float):
+    print(
+        "%s[Info] %d docs done in %.0fs, %.2f docs/s."
+        % (ANSI_ESCAPE_CLEAR_CUR_LINE, done_files, elapsed_time, done_files / elapsed_time),
+        end="",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+def print_intermediate_search_result(best: Optional[SLPLD], done_files: int, elapsed_time: float):
+    if best is not None:
+        sim, para_len, pos, _para, df = best
         print(
             "%s[Info] %d docs done in %.0fs, %.2f docs/s. cur top-1: %.4f %d %s:%d-%d"
             % (
@@ -82,3 +196,29 @@ def print_intermediate_search_result(search_results: List[SLPLD], done_files: in
             file=sys.stderr,
             flush=True,
         )
+
+
+class SearchResultRecord(NamedTuple):
+    """
+    A search result to be shown, which is also the unit of a response of the search server (in JSON).
+    """
+
+    sim: float
+    chars: int
+    file: str
+    begin: int  # line number (1-origin) of the first line of the paragraph
+    end: int  # line number of the last line
+    text: Union[str, List[str]]  # an excerpt, or the lines of the paragraph with option --quote
+
+
+def print_search_result_records(records: Iterable[SearchResultRecord], header: bool, quote: bool) -> None:
+    if header:
+        print("\t".join(["sim", "chars", "location", "text"]))
+    for r in records:
+        if quote:
+            print("%.4f\t%d\t%s:%d-%d" % (r.sim, r.chars, r.file, r.begin, r.end))
+            for L in r.text:
+                print("> %s" % L)
+            print()
+        else:
+            print("%.4f\t%d\t%s:%d-%d\t%s" % (r.sim, r.chars, r.file, r.begin, r.end, r.text))
@@ -0,0 +1,141 @@
+from typing import Callable, List, Optional
+
+import hmac
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import platform
+import secrets
+import traceback
+import urllib.error
+import urllib.request
+
+from .search_result import SearchResultRecord
+
+
+DEFAULT_SERVER_PORT = 8765
+
+_SERVER_HOST = "127.0.0.1"  # the server accepts only local connections
+_SEARCH_PATH = "/search"
+_TOKEN_HEADER = "X-Dvg-Token"
+
+# a function that searches with the command-line arguments and the current directory of a client
+SearchHandler = Callable[[List[str], str], List[SearchResultRecord]]
+
+
+class ServerError(Exception):
+    pass
+
+
+def make_server_token() -> str:
+    return secrets.token_hex(32)
+
+
+def token_file_path(port: int, config_dir: Optional[str] = None) -> str:
+    """
+    Returns the path of the file of the token of the server on the port, in the config directory of the user.
+    """
+    if config_dir is None:
+        if platform.system() == "Windows":
+            base_dir = os.environ.get("APPDATA") or os.path.expanduser("~")
+        else:
+            base_dir = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+        config_dir = os.path.join(base_dir, "dvg")
+    return os.path.join(config_dir, "server-%d.token" % port)
+
+
+def write_token_file(port: int, token: str, config_dir: Optional[str] = None) -> str:
+    """
+    Writes the token of the server to a file only the user can read, and returns the path of the file.
+    """
+    path = token_file_path(port, config_dir)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)  # a file left by a server not shut down cleanly, whose permission is not trusted
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as outp:
+        outp.write(token)
+    return path
+
+
+def read_token_file(port: int, config_dir: Optional[str] = None) -> str:
+    try:
+        with open(token_file_path(port, config_dir)) as inp:
+            return inp.read().strip()
+    except OSError:
+        raise ServerError("Error: no server is running on port %d (start one with `dvg serve`)" % port)
+
+
+def make_search_server(port: int, handle_search: SearchHandler, token: str) -> HTTPServer:
+    """
+    Creates an HTTP server of localhost, which answers a search request in JSON:
+    a request `{"argv": [...], "cwd": "..."}` posted to `/search` is answered with `{"results": [...]}`
+    (items are `SearchResultRecord`s) or `{"error": "..."}`.
+
+    A request should have the token in the header `X-Dvg-Token`, which the server writes to a file only the user
+    can read (see `write_token_file`), because a search reads the files with the permission of the server.
+
+    Requests are processed one by one, because a search changes the current directory of the process.
+    """
+
+    class SearchRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != _SEARCH_PATH:
+                self.send_error(404)
+                return
+
+            try:
+                if not hmac.compare_digest(self.headers.get(_TOKEN_HEADER, ""), token):
+                    status, response = 403, {"error": "Error: the token of the server does not match"}
+                else:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    records = handle_search(list(request["argv"]), request["cwd"])
+                    status, response = 200, {"results": [r._asdict() for r in records]}
+            except SystemExit as e:  # a search exits with an error message, e.g., on a file not found
+                message = e.code if isinstance(e.code, str) else "Error: search exited with status %s" % e.code
+                status, response = 400, {"error": message}
+            except (ValueError, KeyError, TypeError) as e:
+                status, response = 400, {"error": "Error: bad request: %s" % e}
+            except Exception as e:
+                traceback.print_exc()
+                status, response = 500, {"error": "Error: internal error of server: %s" % repr(e)}
+
+            data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # do not log each request
+
+    return HTTPServer((_SERVER_HOST, port), SearchRequestHandler)
+
+
+def request_search(port: int, argv: List[str], cwd: str, token: Optional[str] = None) -> List[SearchResultRecord]:
+    """
+    Requests a search to the server on the port. The token of the server is read from its file, if not given.
+    """
+    if token is None:
+        token = read_token_file(port)
+    data = json.dumps({"argv": argv, "cwd": cwd}, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(
+        "http://%s:%d%s" % (_SERVER_HOST, port, _SEARCH_PATH),
+        data=data,
+        headers={"Content-Type": "application/json", _TOKEN_HEADER: token},
+    )
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))  # never go through a proxy
+    try:
+        with opener.open(req) as resp:
+            response = json.load(resp)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.load(e)["error"]
+        except (ValueError, KeyError):
+            message = "Error: server responded with status %d" % e.code
+        raise ServerError(message)
+    except urllib.error.URLError as e:
+        raise ServerError("Error: failed to connect to the server (start one with `dvg serve`): %s" % e.reason)
+    return [SearchResultRecord(**r) for r in response["results"]]
+
@@ -0,0 +1,113 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .models import SCDVModel
+from .scdv_embedding import Vec, make_scdv_embedding
+from .string_table import StringTable, build_string_table
+
+
+class SharedArray(NamedTuple):
+    shm_name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def share_array(a: np.ndarray, shms: List[SharedMemory]) -> Tuple[np.ndarray, SharedArray]:
+    shm = SharedMemory(create=True, size=max(1, a.nbytes))  # a block of size 0 is not allowed
+    shms.append(shm)
+    sa = np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)
+    sa[...] = a
+    return sa, SharedArray(shm.name, a.shape, a.dtype.str)
+
+
+def attach_array(spec: SharedArray, shms: List[SharedMemory]) -> np.ndarray:
+    shm = SharedMemory(name=spec.shm_name)
+    shms.append(shm)
+    return np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=shm.buf)
+
+
+class SharedModelHandle(NamedTuple):
+    """
+    Picklable description of a model placed on shared memory.
+    Worker processes attach to the shared memory blocks by their names, with `attach_model`.
+    """
+
+    tokenizer_name: str
+    m_shape: Tuple[int, int]
+    query_vec: Optional[Vec]
+    arrays: Dict[str, SharedArray]
+    queries: List[Tuple[Tuple[int, int], Vec]]  # shape of the matrix and query vector of each of multiple queries
+
+
+def share_model(model: SCDVModel) -> Tuple[SharedModelHandle, List[SharedMemory]]:
+    """
+    Places the model (supposed to be optimized for the query already) on shared memory.
+
+    The model itself is also modified so that it refers to the shared memory, that is, the process that
+    calls this function and the ones that attach the model share the same pages of the model data.
+    """
+    shms: List[SharedMemory] = []
+    emb = model.embedder
+
+    w2i = emb.word_to_index
+    if not isinstance(w2i, StringTable):
+        w2i = build_string_table(w2i)
+
+    specs = dict()
+    emb.cluster_idf_wvs, specs["cluster_idf_wvs"] = share_array(emb.cluster_idf_wvs, shms)
+    table_arrays = dict()
+    for name, a in w2i.arrays().items():
+        table_arrays[name], specs["vocab_" + name] = share_array(a, shms)
+    emb.word_to_index = StringTable(**table_arrays)
+
+    # the models optimized for multiple queries (see `SCDVModel.set_queries`) are placed on shared memory, too,
+    # so that worker processes do not make their own copies of the pruned arrays
+    queries = []
+    remaps = []
+    for q, m in enumerate(model.query_models):
+        qemb = m.embedder
+        remap = model._query_remaps[q]
+        remap, specs["query%d_remap" % q] = share_array(remap, shms)
+        remaps.append(remap)
+        qemb.cluster_idf_wvs, specs["query%d_cluster_idf_wvs" % q] = share_array(qemb.cluster_idf_wvs, shms)
+        values, specs["query%d_vocab_values" % q] = share_array(emb.word_to_index.remap_values(remap).values, shms)
+        qemb.word_to_index = StringTable(table_arrays["blob"], table_arrays["offsets"], values, table_arrays["slots"])
+        queries.append((qemb.m_shape, m.query_vec))
+    if model.query_models:
+        model.set_query_models(model.query_models, remaps)
+
+    handle = SharedModelHandle(model.tokenizer_name, emb.m_shape, model.query_vec, specs, queries)
+    return handle, shms
+
+
+def attach_model(handle: SharedModelHandle) -> Tuple[SCDVModel, List[SharedMemory]]:
+    shms: List[SharedMemory] = []
+    arrays = dict((name, attach_array(spec, shms)) for name, spec in handle.arrays.items())
+    table_arrays = dict((name[len("vocab_") :], a) for name, a in arrays.items() if name.startswith("vocab_"))
+    emb = make_scdv_embedding(StringTable(**table_arrays), arrays["cluster_idf_wvs"], handle.m_shape)
+    model = SCDVModel(handle.tokenizer_name, embedder=emb)
+    model.query_vec = handle.query_vec
+    if handle.queries:
+        query_models = []
+        for q, (m_shape, query_vec) in enumerate(handle.queries):
+            values = arrays["query%d_vocab_values" % q]
+            w2i = StringTable(table_arrays["blob"], table_arrays["offsets"], values, table_arrays["slots"])
+            qemb = make_scdv_embedding(w2i, arrays["query%d_cluster_idf_wvs" % q], m_shape)
+            m = SCDVModel(handle.tokenizer_name, embedder=qemb)
+            m.query_vec = query_vec
+            query_models.append(m)
+        model.set_query_models(query_models, [arrays["query%d_remap" % q] for q in range(len(handle.queries))])
+    return model, shms
+
+
+def close_shared_memories(shms: List[SharedMemory], unlink: bool = False) -> None:
+    for shm in shms:
+        try:
+            shm.close()
+        except BufferError:
+            pass  # some arrays are still referring to the block. the block will be unmapped at exit.
+        if unlink:
+            shm.unlink()
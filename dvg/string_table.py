@@ -0,0 +1,118 @@
+from typing import Dict, Iterator, Optional, Tuple
+
+import zlib
+
+import numpy as np
+
+
+class StringTable:
+    """
+    Read-only mapping from str to int, of which contents are stored in flat numpy arrays.
+
+    Keys are stored as a blob of utf-8 bytes with an offset table, and looked up with an open-addressing
+    hash index. Because the table holds no Python objects, it can be placed on shared memory or on a
+    memory-mapped file and be used by multiple processes without copying.
+
+    An entry with a negative value is regarded as removed (see `remap_values`).
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, values: np.ndarray, slots: np.ndarray):
+        assert slots.size >= 1 and slots.size & (slots.size - 1) == 0, "size of slots must be a power of 2"
+        self.blob = blob
+        self.offsets = offsets
+        self.values = values
+        self.slots = slots
+        self._mask = slots.size - 1
+        self._len = int(np.count_nonzero(values >= 0))
+
+        # memoryviews are used in lookup, because indexing a memoryview is much faster than indexing an ndarray
+        self._blob_mv = memoryview(blob)
+        self._offsets_mv = memoryview(offsets)
+        self._values_mv = memoryview(values)
+        self._slots_mv = memoryview(slots)
+
+    def __getstate__(self):
+        return (self.blob, self.offsets, self.values, self.slots)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _find(self, key: str) -> int:
+        kb = key.encode("utf-8")
+        blob, offsets, slots = self._blob_mv, self._offsets_mv, self._slots_mv
+        mask = self._mask
+        h = zlib.crc32(kb) & mask
+        while True:
+            e = slots[h]
+            if e < 0:
+                return -1
+            if blob[offsets[e] : offsets[e + 1]] == kb:
+                return e
+            h = (h + 1) & mask
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        e = self._find(key)
+        if e < 0:
+            return default
+        v = self._values_mv[e]
+        return v if v >= 0 else default
+
+    def __getitem__(self, key: str) -> int:
+        v = self.get(key)
+        if v is None:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        blob, offsets = self._blob_mv, self._offsets_mv
+        for e, v in enumerate(self._values_mv):
+            if v >= 0:
+                yield bytes(blob[offsets[e] : offsets[e + 1]]).decode("utf-8"), v
+
+    def keys(self) -> Iterator[str]:
+        for k, _ in self.items():
+            yield k
+
+    __iter__ = keys
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.items())
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"blob": self.blob, "offsets": self.offsets, "values": self.values, "slots": self.slots}
+
+    def remap_values(self, mapping: np.ndarray) -> "StringTable":
+        """
+        Returns a table of which value of each key is `mapping[value]`. The keys mapped to negative values
+        are removed. The keys and the hash index are shared with this table, that is, nothing is rehashed.
+        """
+        values = np.where(self.values >= 0, mapping[np.maximum(self.values, 0)], -1).astype(np.int32)
+        return StringTable(self.blob, self.offsets, values, self.slots)
+
+
+def build_string_table(mapping: Dict[str, int]) -> StringTable:
+    encoded = [k.encode("utf-8") for k in mapping.keys()]
+    values = np.fromiter(mapping.values(), dtype=np.int32, count=len(mapping))
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(kb) for kb in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8).copy()
+
+    slot_count = 1
+    while slot_count < len(encoded) * 2:  # keep load factor <= 0.5
+        slot_count *= 2
+    slots = np.full(slot_count, -1, dtype=np.int32)
+    mask = slot_count - 1
+    for e, kb in enumerate(encoded):
+        h = zlib.crc32(kb) & mask
+        while slots[h] >= 0:
+            h = (h + 1) & mask
+        slots[h] = e
+
+    return StringTable(blob, offsets, values, slots)
@@ -1,4 +1,6 @@
-from typing import List
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
 
 
 def includes_all_texts(lines: List[str], texts: List[str]) -> bool:
@@ -20,6 +22,81 @@ def includes_any_of_texts(lines: List[str], texts: List[str]) -> bool:
     return False
 
 
+class TextConditions:
+    """
+    The conditions of windows of lines, to include all of the texts `include` (option -i) and none of the texts
+    `exclude` (option -e). A text has to be included in a line, not across lines.
+
+    A whole document is searched for each text first, so a document missing any text of `include` is dropped
+    before looking at its lines or windows, and a text not in the document is not searched for in its lines.
+    Each line is searched for each of the other texts once, and each window is checked with the prefix sums of
+    the lines containing the texts, so that the lines shared by overlapping windows are not searched again.
+    """
+
+    def __init__(self, include: List[str], exclude: List[str]):
+        self.texts = list(dict.fromkeys(include + exclude))
+        self._include_indices = [self.texts.index(t) for t in dict.fromkeys(include)]
+        self._exclude_indices = [self.texts.index(t) for t in dict.fromkeys(exclude)]
+
+    def __bool__(self) -> bool:
+        return bool(self.texts)
+
+    def lines_containing(self, lines: List[str], doc: Optional[str] = None) -> np.ndarray:
+        """
+        Returns a boolean array of shape (number of texts, number of lines), whether each line contains each text.
+        `doc` is the lines joined with line breaks, if already made.
+        """
+        if doc is None:
+            doc = "\n".join(lines)
+        contains = np.zeros((len(self.texts), len(lines)), dtype=bool)
+        for j, t in enumerate(self.texts):
+            if t in doc:
+                contains[j] = np.fromiter((t in L for L in lines), dtype=bool, count=len(lines))
+        return contains
+
+    def _prefix_counts(self, lines: List[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # the numbers of the lines containing each text of `include`, and any text of `exclude`, before each line.
+        # None when the lines can not satisfy the conditions, missing a text of `include`.
+        doc = "\n".join(lines)
+        if not all(self.texts[j] in doc for j in self._include_indices):
+            return None
+        contains = self.lines_containing(lines, doc)
+        inc = contains[self._include_indices]
+        if not np.all(np.any(inc, axis=1)):
+            return None
+        inc_counts = np.zeros((inc.shape[0], len(lines) + 1), dtype=np.int64)
+        np.cumsum(inc, axis=1, out=inc_counts[:, 1:])
+        exc_counts = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum(np.any(contains[self._exclude_indices], axis=0), out=exc_counts[1:])
+        return inc_counts, exc_counts
+
+    @staticmethod
+    def _satisfied(pc: Optional[Tuple[np.ndarray, np.ndarray]], windows: List[Tuple[int, int]]) -> np.ndarray:
+        if pc is None or not windows:
+            return np.zeros(len(windows), dtype=bool)
+        inc_counts, exc_counts = pc
+        ws = np.array(windows, dtype=np.int64).reshape(-1, 2)
+        bs, es = ws[:, 0], ws[:, 1]
+        return np.all(inc_counts[:, es] > inc_counts[:, bs], axis=0) & (exc_counts[es] == exc_counts[bs])
+
+    def satisfied(self, lines: List[str], windows: List[Tuple[int, int]]) -> np.ndarray:
+        """
+        Returns whether each window (a range of the lines) satisfies the conditions.
+        """
+        return self._satisfied(self._prefix_counts(lines), windows)
+
+    def windows_satisfying(self, lines: List[str], windows: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Returns the windows that satisfy the conditions. The windows are not iterated for a document missing a text
+        of `include`.
+        """
+        pc = self._prefix_counts(lines)
+        if pc is None:
+            return []
+        ws = list(windows)
+        return [pos for pos, s in zip(ws, self._satisfied(pc, ws).tolist()) if s]
+
+
 # def split_posi_nega_words(raw_words: Iterable[str]) -> Tuple[List[str], List[str]]:
 #     posi_raw_words = []
 #     nega_raw_words = []
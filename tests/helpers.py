@@ -0,0 +1,17 @@
+import numpy as np
+
+from dvg.models import SCDVModel
+from dvg.scdv_embedding import SCDVEmbedding
+
+
+def build_model() -> SCDVModel:
+    """
+    Builds a small model of random vectors of words "w0" to "w49", with a tokenizer splitting texts at whitespace.
+    """
+    rng = np.random.default_rng(8)
+    words = ["w%d" % i for i in range(50)]
+    clusters = rng.dirichlet(np.ones(6) * 0.2, size=len(words)).astype(np.float32)
+    idf_wvs = rng.normal(size=(len(words), 4)).astype(np.float32)
+    model = SCDVModel("en", embedder=SCDVEmbedding(words, clusters, idf_wvs))
+    model.tokenizer = lambda text: text.split()
+    return model
@@ -5,8 +5,22 @@ import contextlib
 import os
 import sys
 import tempfile
+from types import SimpleNamespace
+
+import numpy as np
 
 from dvg.dvg import prune_overlapped_paragraphs, expand_file_iter
+from dvg.dvg import line_char_offsets, select_candidate_paragraphs, select_paragraphs
+from dvg.dvg import coarse_to_fine_windows, lines_of_windows
+from dvg.dvg import find_similar_paragraphs, find_similar_paragraphs_w, init_worker, parse_search_args
+from dvg.dvg import DEFAULT_WINDOW_SIZE, iter_search_result_records, search
+from dvg.scanners import Scanner
+from dvg.search_index import IndexedFile, SearchIndexWriter, index_document, indexed_file_of
+from dvg.iter_funcs import sliding_window_iter
+from dvg.shared_model import close_shared_memories, share_model
+import dvg.dvg
+
+from .helpers import build_model
 
 
 @contextlib.contextmanager
@@ -56,6 +70,122 @@ class DvgUtilFuncsTest(unittest.TestCase):
         expected = [spps[0], spps[2]]
         self.assertEqual(actual, expected)
 
+    def test_select_candidate_paragraphs(self):
+        lines = ["a b", "c", "d e f g", "h", "i j k"]
+        poss = [(0, 2), (1, 3), (2, 4), (3, 5)]
+        sims = np.array([0.9, 0.6, 0.8, 0.7])
+        para_lens = [sum(len(L) for L in lines[b:e]) for b, e in poss]
+        for paragraph_search in [False, True]:
+            a = SimpleNamespace(min_length=6, paragraph_search=paragraph_search, top_k=3)
+            for sim_min_req in [0.5, 0.75, 0.95]:
+                actual = select_candidate_paragraphs("d", lines, poss, sims, line_char_offsets(lines), a, sim_min_req)
+                expected = select_paragraphs("d", lines, poss, sims.tolist(), para_lens, a, sim_min_req)
+                self.assertEqual(actual, expected)
+                for _sim, _para_len, (b, e), para, _df in actual:
+                    self.assertEqual(para, lines[b:e])  # only the lines of the paragraph
+
+    def test_coarse_to_fine_windows(self):
+        line_count = 100
+        a = SimpleNamespace(window=4, coarse=4)
+        poss = list(sliding_window_iter(line_count, a.window))
+
+        # coarse windows of 16 lines with stride 8; only the one of lines 40-56 is similar
+        def coarse_similarities(cposs: List[Tuple[int, int]]) -> np.ndarray:
+            self.assertEqual(cposs, list(sliding_window_iter(line_count, 16)))
+            return np.array([[0.6 if b == 40 else 0.1 for b, _e in cposs]])
+
+        actual = coarse_to_fine_windows(line_count, poss, a, coarse_similarities, [0.5])
+        self.assertEqual(actual, [(b, e) for b, e in poss if b < 56 and e > 40])
+
+        # any query finding a coarse window promising
+        def coarse_similarities_of_queries(cposs: List[Tuple[int, int]]) -> np.ndarray:
+            return np.array([[0.6 if b == 0 else 0.1 for b, _e in cposs], [0.1 for _ in cposs]])
+
+        actual = coarse_to_fine_windows(line_count, poss, a, coarse_similarities_of_queries, [0.5, 0.5])
+        self.assertEqual(actual, [(b, e) for b, e in poss if b < 16])
+
+        actual = coarse_to_fine_windows(line_count, poss, a, coarse_similarities, [0.1])
+        self.assertEqual(actual, poss)  # all coarse windows are promising
+
+    def test_lines_of_windows(self):
+        lines = ["a", "b", "c", "d", "e", "f"]
+        self.assertEqual(lines_of_windows(lines, [(1, 3), (2, 4)]), ["", "b", "c", "d", "", ""])
+        self.assertEqual(lines_of_windows(lines, [(0, 3), (3, 6)]), lines)
+
+    def test_init_worker(self):
+        # the model is handed to a worker once with init_worker, and each task carries only document file names
+        with tempfile.TemporaryDirectory() as tempdir:
+            dfs = []
+            for i, text in enumerate(["w1 w2\nw5 w9\nw3", "w7 w8\nw1 w3 w3\nw4", "w10 w11"]):
+                dfs.append(os.path.join(tempdir, "d%d.txt" % i))
+                with open(dfs[-1], "w") as outp:
+                    outp.write(text)
+            a = parse_search_args(["-m", "en", "-p", "-w", "2", "-l", "1", "w1 w2 w3"] + dfs)
+            model = build_model()
+            model.set_query(["w1 w2 w3"])
+            expected = find_similar_paragraphs(dfs, model, a)
+            self.assertTrue(expected[0])
+
+            handle, shms = share_model(model)
+            try:
+                init_worker(handle, a)
+                worker_model = dvg.dvg._worker_model
+                worker_model.tokenizer = model.tokenizer  # instead of loading the tokenizer of the name "en"
+                for _ in range(2):
+                    srss, done_dfs, _stats, _hits_misses = find_similar_paragraphs_w(dfs)
+                    self.assertEqual(done_dfs, dfs)
+                    self.assertEqual(srss, expected)
+                self.assertIs(dvg.dvg._worker_model, worker_model)  # the tasks do not load the model again
+            finally:
+                worker_shms = dvg.dvg._worker_shms
+                dvg.dvg._worker_model = worker_model = None
+                close_shared_memories(worker_shms)
+                close_shared_memories(shms, unlink=True)
+
+    def test_iter_search_result_records(self):
+        # the search results found in an index are read from the document files, one by one
+        with tempfile.TemporaryDirectory() as tempdir:
+            dfs = []
+            for i in range(2):
+                dfs.append(os.path.join(tempdir, "d%d.txt" % i))
+                with open(dfs[-1], "w") as outp:
+                    outp.write("w1 w2\nw3 w%d\nw4\n" % i)
+            index = SimpleNamespace(files=[indexed_file_of(df) for df in dfs])
+            a = parse_search_args(["-m", "en", "-q", "w1"] + dfs)
+            model = build_model()
+            model.set_query(["w1"])
+
+            scanned = []
+            scanner = Scanner()
+            scan = scanner.scan
+            scanner.scan = lambda df: scanned.append(df) or scan(df)
+
+            slplds = [(0.9, 5, (0, 2), None, dfs[0]), (0.8, 5, (1, 3), None, dfs[0]), (0.7, 2, (2, 3), None, dfs[1])]
+            it = iter_search_result_records(iter(slplds), model, a, index, scanner)
+            self.assertEqual(next(it).text, ["w1 w2", "w3 w0"])
+            self.assertEqual(scanned, [dfs[0]])  # the records are made as they are consumed
+            self.assertEqual([r.text for r in it], [["w3 w0", "w4"], ["w4"]])
+            self.assertEqual(scanned, [dfs[0], dfs[1]])  # a document is read once for its consecutive records
+
+    def test_search_index_window(self):
+        # a window size other than the one of the index is an error, instead of being ignored
+        with tempfile.TemporaryDirectory() as tempdir:
+            index_dir = os.path.join(tempdir, "idx")
+            model = build_model()
+            writer = SearchIndexWriter(index_dir, "en", "v1", 50, 2)
+            writer.add_document(IndexedFile("d0.txt", 0, 0, ""), index_document(["w1 w2", "w3", "w4"], model, 2))
+            writer.close()
+
+            a = parse_search_args(["-m", "en", "--index-dir", index_dir, "w1"])
+            self.assertFalse(a.window_given)
+            self.assertEqual(a.window, DEFAULT_WINDOW_SIZE)
+
+            a = parse_search_args(["-m", "en", "-w", "3", "--index-dir", index_dir, "w1"])
+            self.assertTrue(a.window_given)
+            with self.assertRaises(SystemExit) as cm:
+                next(search(a, model, "v1"))
+            self.assertEqual(cm.exception.code, "Error: the index is built with another window size (option -w): 2")
+
     def test_expand_file_iter(self):
         with tempfile.TemporaryDirectory() as tempdir:
             with back_to_curdir():
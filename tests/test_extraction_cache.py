@@ -0,0 +1,71 @@
+from typing import *
+
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+from dvg.extraction_cache import *
+from dvg.scanners import Scanner
+
+
+class ExtractionCacheTest(unittest.TestCase):
+    def test_get_put(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ExtractionCache(os.path.join(tempdir, "cache"), 1024 * 1024)
+            p = Path(tempdir) / "a.pdf"
+            p.write_text("dummy")
+
+            self.assertIsNone(cache.get(str(p)))
+            cache.put(str(p), ["1st line.", "2nd line.\r"])
+            self.assertEqual(cache.get(str(p)), ["1st line.", "2nd line.\r"])
+            cache.put(str(p), [])
+            self.assertEqual(cache.get(str(p)), [])
+            self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+            # a modified file does not hit the entry
+            st = os.stat(p)
+            os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            self.assertIsNone(cache.get(str(p)))
+
+            self.assertIsNone(cache.get(os.path.join(tempdir, "not_exist.pdf")))
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ExtractionCache(os.path.join(tempdir, "cache"), 250)
+            files = []
+            for i in range(3):
+                p = Path(tempdir) / ("%d.pdf" % i)
+                p.write_text("dummy")
+                files.append(str(p))
+
+            cache.put(files[0], ["x" * 100])
+            cache.put(files[1], ["y" * 100])
+            self.assertIsNotNone(cache.get(files[0]))  # 0 becomes more recently used than 1
+            os.utime(cache._entry_path(files[1]), ns=(0, 0))
+            cache.put(files[2], ["z" * 100])
+
+            self.assertIsNotNone(cache.get(files[0]))
+            self.assertIsNone(cache.get(files[1]))
+            self.assertIsNotNone(cache.get(files[2]))
+
+    def test_scanner_with_cache(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ExtractionCache(os.path.join(tempdir, "cache"), 1024 * 1024)
+            scanner = Scanner(cache)
+
+            p = Path(tempdir) / "a.html"
+            p.write_text("<html><body><p>1st paragraph.</p><p>2nd paragraph.</p></body></html>")
+            lines = scanner.scan(str(p))
+            self.assertEqual(scanner.scan(str(p)), lines)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            # plain text files are not cached
+            t = Path(tempdir) / "a.txt"
+            t.write_text("1st line.\n2nd line.\n")
+            self.assertEqual(scanner.scan(str(t)), ["1st line.", "2nd line."])
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
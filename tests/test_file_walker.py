@@ -0,0 +1,74 @@
+from typing import *
+
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+from dvg.file_walker import *
+
+
+def make_files(top: str, files: Dict[str, str]) -> None:
+    for name, content in files.items():
+        p = Path(top) / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(content)
+
+
+class FileWalkerTest(unittest.TestCase):
+    def test_extension_and_size(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            make_files(
+                tempdir,
+                {
+                    "a.txt": "x" * 10,
+                    "b.PDF": "x" * 100,
+                    "c.py": "x" * 10,
+                    "d/e.html": "x" * 1000,
+                    "d/f/g.docx": "x" * 10,
+                    "d/f/h": "x" * 10,
+                },
+            )
+            actual = sorted(os.path.relpath(p, tempdir) for p in walk_document_files(tempdir))
+            expected = ["a.txt", "b.PDF", os.path.join("d", "e.html"), os.path.join("d", "f", "g.docx")]
+            self.assertEqual(actual, expected)
+
+            actual = list(walk_document_files(tempdir, min_size=50, max_size=500))
+            self.assertEqual(actual, [os.path.join(tempdir, "b.PDF")])
+
+            actual = [os.path.relpath(p, tempdir) for p in walk_document_files(tempdir, threads=1)]
+            self.assertEqual(sorted(actual), expected)
+
+            actual = sorted((os.path.relpath(p, tempdir), size) for p, size in walk_document_file_sizes(tempdir))
+            self.assertEqual(actual, [(p, os.path.getsize(os.path.join(tempdir, p))) for p in expected])
+
+    def test_ignore_files(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            make_files(
+                tempdir,
+                {
+                    ".dvgignore": "# comment\n*.pdf\nbuild/\nd/skip.txt\n",
+                    "a.txt": "a",
+                    "a.pdf": "a",
+                    "build/b.txt": "b",
+                    "d/build.txt": "b",
+                    "d/skip.txt": "s",
+                    "d/keep.txt": "k",
+                    "d/.dvgignore": "keep.*\n",
+                    "e/keep.txt": "k",
+                },
+            )
+            actual = sorted(os.path.relpath(p, tempdir) for p in walk_document_files(tempdir))
+            expected = ["a.txt", os.path.join("d", "build.txt"), os.path.join("e", "keep.txt")]
+            self.assertEqual(actual, expected)
+
+    def test_stop_in_the_middle(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            make_files(tempdir, dict(("d%d/%d.txt" % (i % 10, i), "x") for i in range(100)))
+            it = walk_document_files(tempdir, threads=4)
+            self.assertTrue(next(it).endswith(".txt"))
+            it.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,9 @@
 from typing import *
 
 import random
+import subprocess
+import sys
+from time import perf_counter
 import unittest
 
 from dvg.iter_funcs import *
@@ -97,6 +100,106 @@ class IterFuncsTest(unittest.TestCase):
                 [(0, 6)],
             )
 
+    def test_prefetch_map(self):
+        def square(x: int) -> int:
+            if x == 7:
+                raise ValueError("seven")
+            return x * x
+
+        stats = PrefetchStats()
+        actual = []
+        for x, fut in prefetch_map(square, range(20), 3, 4, stats):
+            if x == 7:
+                with self.assertRaises(ValueError):
+                    fut.result()
+            else:
+                actual.append((x, fut.result()))
+        self.assertSequenceEqual(actual, [(x, x * x) for x in range(20) if x != 7])
+        self.assertEqual(stats.items, 20)
+
+        # the consumer can stop in the middle
+        it = prefetch_map(square, range(100), 2, 2)
+        self.assertEqual(next(it)[1].result(), 0)
+        it.close()
+
+    def test_prefetch_map_overlaps_subprocesses(self):
+        # a producer waiting for a command (as extracting text with pdftotext commands) overlaps with
+        # a consumer holding the GIL (as scoring), while a producer running Python code would not
+        duration = 0.3
+        items = 6
+
+        def run_command(x: int) -> int:
+            subprocess.run([sys.executable, "-c", "import time; time.sleep(%g)" % duration], check=True)
+            return x
+
+        def busy(seconds: float) -> None:
+            t = perf_counter()
+            while perf_counter() - t < seconds:
+                pass
+
+        t = perf_counter()
+        for x, fut in prefetch_map(run_command, range(items), 2, 4):
+            self.assertEqual(fut.result(), x)
+            busy(duration)
+        elapsed = perf_counter() - t
+
+        serial = items * duration * 2
+        self.assertLess(elapsed, serial * 0.75)
+
+    def test_weighted_chunked_iter(self):
+        weights = [1, 50, 2, 3, 100, 1, 1, 4, 2, 30]
+        chunks = list(weighted_chunked_iter(range(len(weights)), lambda i: weights[i], 10, 3, 5))
+
+        # each lookahead buffer of 5 items is scheduled from the heaviest
+        self.assertEqual(chunks, [[4], [1], [3, 2, 0], [9], [7, 8, 5], [6]])
+
+        chunks = list(weighted_chunked_iter(range(len(weights)), lambda i: weights[i], 1000, 100, 100))
+        self.assertEqual(chunks, [[4, 1, 9, 7, 3, 2, 8, 0, 5, 6]])
+
+        self.assertEqual(list(weighted_chunked_iter([], lambda i: 1, 10, 3, 5)), [])
+
+    def test_weighted_chunked_iter_parts(self):
+        # a buffer of many light items is split into at least `parts` chunks, not packed into a single one
+        workers = 16
+        chunks = list(weighted_chunked_iter(range(1500), lambda i: 1, 1000, 1000, 1500, workers))
+        self.assertGreaterEqual(len(chunks), workers)
+        self.assertEqual(sorted(i for c in chunks for i in c), list(range(1500)))
+
+        # the first chunks are yielded before the lookahead buffer is filled
+        consumed = []
+
+        def gen():
+            for i in range(1500):
+                consumed.append(i)
+                yield i
+
+        it = weighted_chunked_iter(gen(), lambda i: 1, 1000, 1000, 1500, workers)
+        next(it)
+        self.assertLess(len(consumed), 1500)
+
+    def test_threaded_iter(self):
+        self.assertEqual(list(threaded_iter(range(100), 3)), list(range(100)))
+
+    def test_rolling_window_iter(self):
+        rand = random.Random(123)
+        for _ in range(1000):
+            range_length = rand.randrange(0, 50)
+            window = rand.randrange(1, 20)
+            items = list(range(range_length))
+            blocks = []
+            i = 0
+            while i < range_length:
+                n = rand.randrange(1, 10)
+                blocks.append(items[i : i + n])
+                i += n
+
+            expected = [items[b:e] for b, e in sliding_window_iter(range_length, window)]
+            actual = []
+            for base, buf, poss in rolling_window_iter(blocks, window):
+                self.assertLessEqual(len(buf), window + 10)
+                actual.extend(buf[b:e] for b, e in poss)
+            self.assertEqual(actual, expected)
+
 
 if __name__ == "__main__":
     unittest.main()
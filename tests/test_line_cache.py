@@ -0,0 +1,38 @@
+from typing import *
+
+import unittest
+
+from dvg.line_cache import *
+
+
+class LineWordIdCacheTest(unittest.TestCase):
+    def test_get_put(self):
+        cache = LineWordIdCache(1024 * 1024)
+        self.assertIsNone(cache.get("a b"))
+        cache.put("a b", (1, 2))
+        cache.put("", ())
+        self.assertEqual(cache.get("a b"), (1, 2))
+        self.assertEqual(cache.get(""), ())
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        cache.clear()
+        self.assertIsNone(cache.get("a b"))
+
+    def test_lru_eviction(self):
+        cache = LineWordIdCache(1000)
+        cache.put("x" * 200, (1,))
+        cache.put("y" * 200, (2,))
+        self.assertIsNotNone(cache.get("x" * 200))  # x becomes more recently used than y
+        cache.put("z" * 200, (3,))
+
+        self.assertIsNotNone(cache.get("x" * 200))
+        self.assertIsNone(cache.get("y" * 200))
+        self.assertIsNotNone(cache.get("z" * 200))
+
+        cache.put("w" * 2000, (4,))  # larger than the cache
+        self.assertIsNone(cache.get("w" * 2000))
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
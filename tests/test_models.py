@@ -4,8 +4,13 @@ import unittest
 import os
 import tempfile
 
+import numpy as np
+
 from dvg.models import ModelSpec, find_model_spec
 from dvg.models import ModelUrl, find_model_url
+from dvg.line_cache import LineWordIdCache
+
+from .helpers import build_model
 
 
 def save_file(file_name: str, contents: Union[str, bytes]):
@@ -52,3 +57,66 @@ class ModelTest(unittest.TestCase):
                     "d2e3e7a318991460328ae3745fef79be99e49a5eae8b43a74535af530a750349",
                 ),
             )
+
+
+class MultiQueryTest(unittest.TestCase):
+    def test_similarities_of_queries(self):
+        rng = np.random.default_rng(9)
+        lines = [" ".join("w%d" % i for i in rng.choice(50, size=rng.integers(1, 8))) + " x" for _ in range(30)]
+        windows = [(b, min(b + 5, len(lines))) for b in range(0, len(lines), 2)]
+        queries = [["w1 w2 w3"], ["w10", "w20 w30"], ["w4 w4 w44"]]
+
+        model = build_model()
+        model.set_queries(queries)
+        simss = model.similarities_to_windows_of_queries(model.lines_to_word_ids(lines), windows)
+        self.assertEqual(simss.shape, (len(queries), len(windows)))
+
+        # the same as the model optimized for each query
+        for q, query in enumerate(queries):
+            m = build_model()
+            m.set_query(query)
+            self.assertTrue(np.allclose(simss[q], m.similarities_to_line_ranges(lines, windows)))
+            single_simss = m.similarities_to_windows_of_queries(m.lines_to_word_ids(lines), windows)
+            self.assertTrue(np.allclose(single_simss, simss[q : q + 1]))
+            self.assertTrue(np.array_equal(model.query_models[q].get_query_vec(), m.get_query_vec()))
+
+    def test_windows_to_score(self):
+        rng = np.random.default_rng(10)
+        lines = [" ".join("w%d" % i for i in rng.choice(50, size=rng.integers(0, 3))) for _ in range(40)]
+        windows = [(b, min(b + 3, len(lines))) for b in range(0, len(lines), 1)]
+        queries = [["w1 w2 w3"], ["w10", "w20 w30"]]
+
+        model = build_model()
+        model.set_queries(queries)
+        lw = model.lines_to_word_ids(lines)
+        to_score = model.windows_to_score(lw, windows)
+        self.assertTrue(0 < len(to_score) < len(windows))
+
+        # the windows not to be scored have no positive similarity to any query
+        simss = model.similarities_to_windows_of_queries(lw, windows)
+        for w, pos in enumerate(windows):
+            if pos not in to_score:
+                self.assertTrue(np.all(simss[:, w] <= 0.0))
+        positive_simss = model.similarities_to_windows_of_queries(lw, windows, positive_only=True)
+        self.assertTrue(np.allclose(positive_simss, np.maximum(simss, 0.0)))
+
+        self.assertEqual(model.windows_to_score(model.lines_to_word_ids(["x y", ""]), [(0, 2)]), [])
+
+
+class LineCacheTest(unittest.TestCase):
+    def test_lines_to_word_ids_with_line_cache(self):
+        lines = ["w1 w2 x", "w3", "", "w1 w2 x", "w4 w4 w5", "w3"]
+        model = build_model()
+        model.set_query(["w1 w3"])
+        expected = model.lines_to_word_ids(lines)
+
+        model.line_cache = LineWordIdCache(1024 * 1024)
+        for _ in range(2):
+            actual = model.lines_to_word_ids(lines)
+            self.assertEqual(actual.ids.tolist(), expected.ids.tolist())
+            self.assertEqual(actual.offsets.tolist(), expected.offsets.tolist())
+        self.assertEqual((model.line_cache.hits, model.line_cache.misses), (8, 4))
+
+        # the word ids depend on the query
+        model.set_query(["w4 w5"])
+        self.assertEqual(len(model.line_cache), 0)
@@ -0,0 +1,68 @@
+from typing import *
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from dvg.models import SCDVModel
+from dvg.native_model import *
+from dvg.scdv_embedding import read_scdv_embedding
+
+
+def save_pkl_model(file_name: str, words: List[str]) -> None:
+    rng = np.random.default_rng(7)
+    clusters = rng.dirichlet(np.ones(5) * 0.3, size=len(words)).astype(np.float32)
+    idf_wvs = rng.normal(size=(len(words), 3)).astype(np.float32)
+    with open(file_name, "wb") as outp:
+        pickle.dump({"words": words, "clusters": clusters, "idf_wvs": idf_wvs}, outp)
+
+
+class NativeModelTest(unittest.TestCase):
+    def test_convert_and_read(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pkl_file = os.path.join(tempdir, "m.pkl")
+            save_pkl_model(pkl_file, ["w%d" % i for i in range(30)])
+
+            native_dir = prepare_native_model(pkl_file)
+            self.assertEqual(native_dir, os.path.join(tempdir, "m" + NATIVE_MODEL_SUFFIX))
+            self.assertTrue(is_native_model_up_to_date(pkl_file, native_dir))
+
+            expected = read_scdv_embedding(pkl_file)
+            actual = read_native_scdv_embedding(native_dir)
+            self.assertIsInstance(actual.cluster_idf_wvs, np.memmap)
+            self.assertTrue(np.array_equal(np.asarray(actual.cluster_idf_wvs), expected.cluster_idf_wvs))
+            self.assertEqual(actual.m_shape, expected.m_shape)
+            self.assertEqual(actual.word_to_index.to_dict(), expected.word_to_index)
+
+            # a query-optimized model works the same as the one loaded from the pickle
+            m1 = SCDVModel("en", embedder=expected)
+            m2 = SCDVModel("en", native_dir)
+            for m in [m1, m2]:
+                m.tokenizer = lambda text: text.split()
+                m.set_query(["w1 w2 w3"])
+            lines = ["w1 w4 w9 x", "w3 w3 w20", "w7"]
+            ranges = [(0, 2), (1, 3)]
+            sims1 = m1.similarities_to_line_ranges(lines, ranges)
+            self.assertTrue(np.allclose(m2.similarities_to_line_ranges(lines, ranges), sims1))
+            self.assertEqual(m2.lines_to_word_ids(lines).ids.tolist(), m1.lines_to_word_ids(lines).ids.tolist())
+
+    def test_reconvert_modified_model(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pkl_file = os.path.join(tempdir, "m.pkl")
+            save_pkl_model(pkl_file, ["a", "b"])
+            native_dir = prepare_native_model(pkl_file)
+
+            save_pkl_model(pkl_file, ["a", "b", "c"])
+            st = os.stat(pkl_file)
+            os.utime(pkl_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            self.assertFalse(is_native_model_up_to_date(pkl_file, native_dir))
+            prepare_native_model(pkl_file)
+            self.assertIn("c", read_native_scdv_embedding(native_dir).word_to_index)
+            self.assertEqual(sorted(os.listdir(tempdir)), ["m.mmap", "m.pkl"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,62 @@
+from typing import *
+
 import unittest
 
+import importlib.util
+import os
 from pathlib import Path
+import platform
 import re
+import shutil
+import sys
 import tempfile
+import time
 
 import dvg
 
 
+def write_text_pdf(file_name: str, page_texts: List[str]) -> None:
+    """
+    Writes a minimal PDF file, each page of which has a line of text.
+    """
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode("ascii")
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objs.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % (len(objs))
+        )
+        kids.append(b"%d 0 R" % len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objs):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i + 1, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for o in offsets:
+        out += b"%010d 00000 n \n" % o
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    with open(file_name, "wb") as outp:
+        outp.write(out)
+
+
+# a stand-in of the pdftotext command, which takes a second and writes a large text of the page range
+FAKE_PDFTOTEXT_SCRIPT = """\
+import sys, time
+args = sys.argv[1:]
+first, last = int(args[args.index("-f") + 1]), int(args[args.index("-l") + 1])
+time.sleep(1.0)
+with open(args[-1], "w", encoding="utf-8") as outp:
+    for i in range(first, last + 1):
+        outp.write(("page %d " % i) * 1000 + "\\n")
+"""
+
+
 class ScannerTest(unittest.TestCase):
     def test_text_file(self):
         with tempfile.TemporaryDirectory() as tempdir:
@@ -16,6 +66,22 @@ class ScannerTest(unittest.TestCase):
             read_content = dvg.scanners.read_text_file(str(p))
             self.assertEqual(read_content, content)
 
+    def test_scan_blocks(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            p = Path(tempdir) / "a.txt"
+            p.write_text("".join("line %d,\t\u3000 %s\r\n\n" % (i, "x" * (i % 7)) for i in range(1000)))
+            scanner = dvg.scanners.Scanner()
+            lines = scanner.scan(str(p))
+            saved = dvg.scanners._STREAMING_BLOCK_CHARS
+            try:
+                dvg.scanners._STREAMING_BLOCK_CHARS = 100
+                blocks = list(scanner.scan_blocks(str(p)))
+            finally:
+                dvg.scanners._STREAMING_BLOCK_CHARS = saved
+            self.assertGreater(len(blocks), 1)
+            self.assertEqual([L for b in blocks for L in b], lines)
+            self.assertFalse(scanner.is_streamed(str(p)))  # a small file
+
     def test_html_file(self):
         with tempfile.TemporaryDirectory() as tempdir:
             p = Path(tempdir) / "a.html"
@@ -75,6 +141,62 @@ class ScannerTest(unittest.TestCase):
     #         read_content = re.sub(r'\n+', r'\n', read_content).rstrip()
     #         self.assertEqual(read_content, '1st paragraph.\n2nd paragraph.')
 
+    def test_pdf_page_ranges(self):
+        self.assertEqual(dvg.scanners.pdf_page_ranges(10, 4), [(0, 10)])
+        self.assertEqual(dvg.scanners.pdf_page_ranges(0, 4), [(0, 0)])
+
+        for page_count, max_parts in [(200, 4), (1999, 4), (2000, 64), (2001, 3)]:
+            ranges = dvg.scanners.pdf_page_ranges(page_count, max_parts)
+            self.assertTrue(1 < len(ranges) <= max_parts)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], page_count)
+            for (b1, e1), (b2, e2) in zip(ranges, ranges[1:]):
+                self.assertEqual(e1, b2)
+            self.assertLessEqual(max(e - b for b, e in ranges) - min(e - b for b, e in ranges), 1)
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("pdftotext") is not None and shutil.which("pdftotext") is not None,
+        "pdftotext is not installed",
+    )
+    def test_pdf_scan_in_parallel(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            p = str(Path(tempdir) / "a.pdf")
+            write_text_pdf(p, ["page %d of the document" % i for i in range(dvg.scanners.PDF_PARALLEL_PAGES + 50)])
+
+            single = dvg.scanners.to_lines(dvg.scanners.pdf_scan(p, 1))
+            self.assertEqual(len(single), dvg.scanners.PDF_PARALLEL_PAGES + 50)
+            self.assertEqual(dvg.scanners.to_lines(dvg.scanners.pdf_scan(p, 4)), single)
+
+    @unittest.skipUnless(shutil.which("pdftotext") is not None, "pdftotext is not installed")
+    def test_pdftotext_page_ranges(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            p = str(Path(tempdir) / "a.pdf")
+            write_text_pdf(p, ["page %d of the document" % i for i in range(dvg.scanners.PDF_PARALLEL_PAGES + 50)])
+
+            command = shutil.which("pdftotext")
+            unsplit = dvg.scanners.to_lines(dvg.scanners.pdftotext_page_ranges(command, p, [(0, 0)]))
+            self.assertEqual(len(unsplit), dvg.scanners.PDF_PARALLEL_PAGES + 50)
+            ranges = dvg.scanners.pdf_page_ranges(dvg.scanners.PDF_PARALLEL_PAGES + 50, 3)
+            self.assertGreaterEqual(len(ranges), 2)
+            split = dvg.scanners.to_lines(dvg.scanners.pdftotext_page_ranges(command, p, ranges))
+            self.assertEqual(split, unsplit)
+
+    @unittest.skipIf(platform.system() == "Windows", "the fake command is a script with a shebang line")
+    def test_pdftotext_page_ranges_in_parallel(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            command = os.path.join(tempdir, "pdftotext")
+            with open(command, "w") as outp:
+                outp.write("#!%s\n%s" % (sys.executable, FAKE_PDFTOTEXT_SCRIPT))
+            os.chmod(command, 0o755)
+
+            # the ranges are extracted at once, although each range is larger than a pipe buffer
+            ranges = [(0, 100), (100, 200), (200, 300), (300, 400)]
+            t = time.time()
+            lines = dvg.scanners.to_lines(dvg.scanners.pdftotext_page_ranges(command, "a.pdf", ranges))
+            elapsed = time.time() - t
+            self.assertEqual([L.split(" ")[1] for L in lines], [str(i + 1) for i in range(400)])
+            self.assertLess(elapsed, 3.0)
+
 
 if __name__ == "__main__":
     unittest.main()
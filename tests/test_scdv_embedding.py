@@ -120,6 +120,79 @@ class SCDVEmgeddingTest(unittest.TestCase):
         self.assertEqual(len(emb.word_to_index), emb.cluster_idf_wvs.shape[0])
         self.assertTrue(emb.cluster_idf_wvs.shape[1] > 0)
 
+    def test_otpimization_same_as_per_word_similarity(self):
+        rng = np.random.default_rng(1)
+        words = ["w%d" % i for i in range(300)]
+        clusters = rng.dirichlet(np.ones(4) * 0.1, size=len(words)).astype(np.float32)
+        idf_wvs = rng.normal(size=(len(words), 5)).astype(np.float32)
+        idf_wvs[rng.random(len(words)) < 0.3] *= 1e-4  # words of tiny weight, to be removed
+
+        emb = SCDVEmbedding(words, clusters, idf_wvs)
+        query_vec = emb.embed(["w1", "w2", "w3"])
+        sq = sparse(query_vec)
+        expected = [w for w in words if abs(inner_product_n(emb.embed([w]), sq)) >= 0.001]
+        emb.optimize_for_query_vec(query_vec)
+
+        self.assertTrue(0 < len(expected) < len(words))
+        self.assertEqual(emb.word_to_index, dict((w, i) for i, w in enumerate(expected)))
+        self.assertEqual(emb.cluster_idf_wvs.shape[0], len(expected))
+
+    def test_query_scorer(self):
+        rng = np.random.default_rng(2)
+        words = ["w%d" % i for i in range(50)]
+        clusters = rng.dirichlet(np.ones(6) * 0.3, size=len(words)).astype(np.float32)
+        idf_wvs = rng.normal(size=(len(words), 4)).astype(np.float32)
+
+        emb = SCDVEmbedding(words, clusters, idf_wvs)
+        query_vec = emb.embed(["w1", "w2", "w3", "w3"])
+        scorer = QueryScorer(emb, query_vec)
+        bags = [list(rng.choice(words + ["oov"], size=n)) for n in [0, 1, 2, 5, 30, 200]]
+        lw = to_lines_word_ids([[emb.word_to_index[w] for w in bag if w != "oov"] for bag in bags])
+        sims = scorer.similarities(lw, np.array([(i, i + 1) for i in range(len(bags))]))
+        for bag, sim in zip(bags, sims):
+            self.assertAlmostEqual(sim, inner_product_n(emb.embed(bag), query_vec), places=5)
+
+    def test_window_word_counts(self):
+        lw = to_lines_word_ids([[1, 2], [], [2, 2, 3], [4], [1], [3, 5]])
+        windows = np.array([(0, 2), (1, 3), (1, 2), (3, 6), (5, 6), (0, 6)])
+        win, ids, counts = window_word_counts(lw, windows, 6)
+        for w, (b, e) in enumerate(windows):
+            expected = dict()
+            for i in lw.ids[lw.offsets[b] : lw.offsets[e]]:
+                expected[i] = expected.get(i, 0) + 1
+            actual = dict((i, c) for wi, i, c in zip(win, ids, counts) if wi == w)
+            self.assertEqual(actual, expected)
+
+    def test_query_scorer_similarities(self):
+        rng = np.random.default_rng(3)
+        words = ["w%d" % i for i in range(50)]
+        clusters = rng.dirichlet(np.ones(6) * 0.3, size=len(words)).astype(np.float32)
+        idf_wvs = rng.normal(size=(len(words), 4)).astype(np.float32)
+
+        emb = SCDVEmbedding(words, clusters, idf_wvs)
+        query_vec = emb.embed(["w1", "w2", "w3", "w3"])
+        scorer = QueryScorer(emb, query_vec)
+
+        lines = [list(rng.choice(words, size=rng.integers(0, 8))) for _ in range(40)]
+        lw = to_lines_word_ids([[emb.word_to_index[w] for w in L] for L in lines])
+        windows = np.array([(b, min(b + 4, len(lines))) for b in range(0, len(lines), 2)] + [(3, 3), (0, 40)])
+        sims = scorer.similarities(lw, windows)
+        for (b, e), sim in zip(windows, sims):
+            bag = [w for L in lines[b:e] for w in L]
+            self.assertAlmostEqual(sim, inner_product_n(emb.embed(bag), query_vec), places=5)
+
+        # the similarities that can not be positive are given as zero
+        positive_sims = scorer.similarities(lw, windows, positive_only=True)
+        self.assertTrue(np.allclose(positive_sims, np.maximum(sims, 0.0)))
+
+    def test_windows_having_words(self):
+        lw = to_lines_word_ids([[1, 2], [], [2, 2, 3], [4], [1], [3, 5]])
+        windows = np.array([(0, 2), (1, 3), (1, 2), (3, 6), (5, 6), (0, 6), (3, 5)])
+        word_mask = np.array([False, False, False, True, False, True])
+        actual = windows_having_words(lw, windows, word_mask)
+        expected = [any(word_mask[i] for i in lw.ids[lw.offsets[b] : lw.offsets[e]]) for b, e in windows]
+        self.assertEqual(actual.tolist(), expected)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,111 @@
+from typing import *
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from dvg.search_index import *
+
+from .helpers import build_model
+
+
+class SearchIndexTest(unittest.TestCase):
+    def test_build_and_search(self):
+        rng = np.random.default_rng(5)
+        docs = []
+        for n in [0, 3, 17]:
+            docs.append([" ".join("w%d" % i for i in rng.choice(50, size=rng.integers(1, 6))) for _ in range(n)])
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            index_dir = os.path.join(tempdir, "idx")
+            self.assertFalse(index_exists(index_dir))
+
+            model = build_model()
+            writer = SearchIndexWriter(index_dir, "test", "v1", 50, 4)
+            for i, doc in enumerate(docs):
+                writer.add_document(IndexedFile("d%d.txt" % i, 0, 0, ""), index_document(doc, model, 4))
+            writer.close()
+            self.assertTrue(index_exists(index_dir))
+
+            # the query-optimized model prunes the vocabulary, which the index should follow
+            model.set_query(["w1 w2 w3"])
+            index = SearchIndex(index_dir)
+            self.assertEqual([f.path for f in index.files], ["d0.txt", "d1.txt", "d2.txt"])
+            sims = index.similarities(model)
+
+            for i, doc in enumerate(docs):
+                ws = np.asarray(index.windows)
+                ws = ws[ws[:, W_FILE] == i]
+                poss = [(b, e) for b, e in ws[:, W_BEGIN : W_END + 1].tolist()]
+                expected = model.similarities_to_line_ranges(doc, poss)
+                actual = sims[np.flatnonzero(np.asarray(index.windows)[:, W_FILE] == i)]
+                self.assertTrue(np.allclose(actual, expected))
+                for (b, e), para_len in zip(poss, ws[:, W_PARA_LEN]):
+                    self.assertEqual(para_len, sum(len(L) for L in doc[b:e]))
+
+            positive_sims = index.similarities(model, positive_only=True)
+            self.assertTrue(np.allclose(positive_sims, np.maximum(sims, 0.0)))
+
+    def test_update_copies_document_data(self):
+        rng = np.random.default_rng(6)
+        docs = []
+        for n in [5, 0, 9]:
+            docs.append([" ".join("w%d" % i for i in rng.choice(50, size=rng.integers(1, 6))) for _ in range(n)])
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            index_dir = os.path.join(tempdir, "idx")
+            model = build_model()
+            writer = SearchIndexWriter(index_dir, "test", "v1", 50, 4)
+            for i, doc in enumerate(docs):
+                writer.add_document(IndexedFile("d%d.txt" % i, 0, 0, ""), index_document(doc, model, 4))
+            writer.close()
+
+            # an update drops d0.txt and copies the others
+            old = SearchIndex(index_dir)
+            writer = SearchIndexWriter(index_dir, "test", "v1", 50, 4, generation=old.generation + 1)
+            for i in [2, 1]:
+                writer.add_document(old.files[i], old.document_data(i))
+            old.close()
+            writer.close()
+            self.assertEqual(
+                sorted(os.listdir(index_dir)), ["entry_counts.1.bin", "entry_ids.1.bin", "index.json", "windows.1.bin"]
+            )
+
+            model.set_query(["w4 w5 w6"])
+            index = SearchIndex(index_dir)
+            self.assertEqual([f.path for f in index.files], ["d2.txt", "d1.txt"])
+            poss = [(b, e) for b, e in np.asarray(index.windows)[:, W_BEGIN : W_END + 1].tolist()]
+            expected = model.similarities_to_line_ranges(docs[2], poss)
+            self.assertTrue(np.allclose(index.similarities(model), expected))
+
+    def test_is_file_unchanged(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "a.txt")
+            with open(path, "w") as outp:
+                outp.write("hello")
+            f = indexed_file_of(path, content_hash=True)
+            self.assertTrue(is_file_unchanged(f)[0])
+
+            # touched but same content
+            os.utime(path, ns=(f.mtime_ns + 10**9, f.mtime_ns + 10**9))
+            unchanged, g = is_file_unchanged(f)
+            self.assertTrue(unchanged)
+            self.assertNotEqual(g.mtime_ns, f.mtime_ns)
+
+            with open(path, "w") as outp:
+                outp.write("world")
+            self.assertFalse(is_file_unchanged(f)[0])
+
+            os.remove(path)
+            self.assertFalse(is_file_unchanged(f)[0])
+
+    def test_not_found(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            with self.assertRaises(SearchIndexError):
+                SearchIndex(os.path.join(tempdir, "idx"))
+
+
+if __name__ == "__main__":
+    unittest.main()
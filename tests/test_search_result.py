@@ -0,0 +1,48 @@
+from typing import *
+
+import random
+import unittest
+
+from dvg.search_result import *
+
+
+def random_search_results(count: int) -> List[SLPLD]:
+    rng = random.Random(1)
+    slplds: List[SLPLD] = []
+    for i in range(count):
+        sim = rng.choice([0.5, 0.6, 0.7, rng.random()])  # some results tie in similarity
+        slplds.append((sim, rng.randrange(100), (i, i + 3), ["line %d" % i], "doc%d.txt" % (i % 7)))
+    return slplds
+
+
+class TopKCollectorTest(unittest.TestCase):
+    def test_top_k(self):
+        slplds = random_search_results(500)
+        expected = slplds[:]
+        trim_search_results(expected, 20)
+
+        c = TopKCollector(20)
+        self.assertEqual(c.threshold(), -float("inf"))
+        c.extend(slplds)
+        self.assertTrue(c.is_full())
+        self.assertEqual(c.results(), expected)
+        self.assertEqual(c.threshold(), expected[-1][0])
+        self.assertEqual(c.best(), expected[0])
+
+    def test_all_with_spilling(self):
+        slplds = random_search_results(500)
+        expected = slplds[:]
+        trim_search_results(expected, len(expected))
+
+        c = TopKCollector(0, spill_results=64)
+        c.extend(slplds)
+        self.assertFalse(c.is_full())
+        self.assertEqual(len(c), 500)
+        self.assertGreater(len(c._runs), 0)
+        self.assertEqual(c.results(), expected)
+        self.assertEqual(list(c.iter_results()), expected)  # can be iterated again
+        c.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
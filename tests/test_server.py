@@ -0,0 +1,70 @@
+from typing import *
+
+import os
+import platform
+import tempfile
+import threading
+import unittest
+
+from dvg.search_result import SearchResultRecord
+from dvg.server import *
+
+
+class ServerTest(unittest.TestCase):
+    def test_search_request(self):
+        def handle_search(argv: List[str], cwd: str) -> List[SearchResultRecord]:
+            if argv == ["bad"]:
+                raise SystemExit("Error: bad argument")
+            return [
+                SearchResultRecord(0.9, 100, "%s/a.txt" % cwd, 1, 20, "excerpt of %s" % " ".join(argv)),
+                SearchResultRecord(0.8, 50, "b.txt", 3, 4, ["line 3", "日本語"]),
+            ]
+
+        token = make_server_token()
+        server = make_search_server(0, handle_search, token)  # port 0 means any free port
+        port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            records = request_search(port, ["-m", "en", "query"], "/work", token)
+            self.assertEqual(
+                records,
+                [
+                    SearchResultRecord(0.9, 100, "/work/a.txt", 1, 20, "excerpt of -m en query"),
+                    SearchResultRecord(0.8, 50, "b.txt", 3, 4, ["line 3", "日本語"]),
+                ],
+            )
+
+            with self.assertRaises(ServerError) as cm:
+                request_search(port, ["bad"], "/work", token)
+            self.assertEqual(str(cm.exception), "Error: bad argument")
+
+            # a request without the token of the server is rejected before searching
+            with self.assertRaises(ServerError) as cm:
+                request_search(port, ["-m", "en", "query"], "/work", "0" * len(token))
+            self.assertIn("token", str(cm.exception))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        with self.assertRaises(ServerError):
+            request_search(port, ["-m", "en", "query"], "/work", token)
+
+    def test_token_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            config_dir = os.path.join(tempdir, "dvg")
+            with self.assertRaises(ServerError):
+                read_token_file(8765, config_dir)
+
+            path = write_token_file(8765, "abc", config_dir)
+            self.assertEqual(read_token_file(8765, config_dir), "abc")
+            if platform.system() != "Windows":
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+            write_token_file(8765, "def", config_dir)  # a file left by a previous server is replaced
+            self.assertEqual(read_token_file(8765, config_dir), "def")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+from typing import *
+
+from multiprocessing import get_context
+import unittest
+
+import numpy as np
+
+from dvg.scdv_embedding import LinesWordIds
+from dvg.shared_model import *
+from dvg.string_table import StringTable
+
+from .helpers import build_model
+
+
+def embed_in_child(handle: SharedModelHandle) -> List[float]:
+    model, shms = attach_model(handle)
+    try:
+        assert isinstance(model.embedder.word_to_index, StringTable)
+        return model.embedder.embed(["w1", "w3", "w3", "x"]).tolist()
+    finally:
+        del model
+        close_shared_memories(shms)
+
+
+def similarities_of_queries_in_child(
+    handle: SharedModelHandle, lw: LinesWordIds, windows: List[Tuple[int, int]]
+) -> Tuple[List[List[float]], bool]:
+    model, shms = attach_model(handle)
+    try:
+        on_shared_memory = all(not m.embedder.cluster_idf_wvs.flags.owndata for m in model.query_models)
+        return model.similarities_to_windows_of_queries(lw, windows).tolist(), on_shared_memory
+    finally:
+        del model
+        close_shared_memories(shms)
+
+
+class SharedModelTest(unittest.TestCase):
+    def test_share_and_attach(self):
+        model = build_model()
+        expected = model.embedder.embed(["w1", "w3", "w3", "x"])
+
+        handle, shms = share_model(model)
+        try:
+            self.assertIsInstance(model.embedder.word_to_index, StringTable)
+            self.assertTrue(np.allclose(model.embedder.embed(["w1", "w3", "w3", "x"]), expected))
+
+            with get_context("spawn").Pool(1) as pool:
+                actual = pool.apply(embed_in_child, (handle,))
+            self.assertTrue(np.allclose(np.array(actual), expected))
+        finally:
+            close_shared_memories(shms, unlink=True)
+
+    def test_share_and_attach_queries(self):
+        model = build_model()
+        model.set_queries([["w1 w2"], ["w3 w4 w4"], ["w4"]])
+        lw = model.lines_to_word_ids(["w1 x", "w2 w3", "w4 w4", "w3"])
+        windows = [(0, 2), (1, 3), (2, 4), (0, 4)]
+        expected = model.similarities_to_windows_of_queries(lw, windows)
+
+        handle, shms = share_model(model)
+        try:
+            self.assertTrue(np.allclose(model.similarities_to_windows_of_queries(lw, windows), expected))
+
+            with get_context("spawn").Pool(1) as pool:
+                actual, on_shared_memory = pool.apply(similarities_of_queries_in_child, (handle, lw, windows))
+            self.assertTrue(np.allclose(np.array(actual), expected))
+            self.assertTrue(on_shared_memory)  # the pruned arrays of the queries are not copied in the child
+        finally:
+            close_shared_memories(shms, unlink=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+from typing import *
+
+import pickle
+import unittest
+
+import numpy as np
+
+from dvg.string_table import *
+
+
+class StringTableTest(unittest.TestCase):
+    def test_lookup(self):
+        mapping = dict((w, i * 10) for i, w in enumerate(["a", "b", "ab", "日本", "", "a b"]))
+        table = build_string_table(mapping)
+
+        self.assertEqual(len(table), len(mapping))
+        for w, i in mapping.items():
+            self.assertIn(w, table)
+            self.assertEqual(table.get(w), i)
+            self.assertEqual(table[w], i)
+
+        self.assertNotIn("c", table)
+        self.assertIsNone(table.get("c"))
+        self.assertEqual(table.get("ba", -1), -1)
+        with self.assertRaises(KeyError):
+            table["abc"]
+
+        self.assertEqual(table.to_dict(), mapping)
+        self.assertEqual(sorted(table.keys()), sorted(mapping.keys()))
+
+    def test_empty(self):
+        table = build_string_table(dict())
+        self.assertEqual(len(table), 0)
+        self.assertNotIn("a", table)
+        self.assertEqual(list(table.items()), [])
+
+    def test_many_keys(self):
+        mapping = dict(("w%d" % i, i) for i in range(5000))
+        table = build_string_table(mapping)
+        for w, i in mapping.items():
+            self.assertEqual(table.get(w), i)
+        self.assertNotIn("w5000", table)
+
+    def test_remap_values(self):
+        mapping = {"x": 0, "y": 1, "z": 2}
+        table = build_string_table(mapping).remap_values(np.array([-1, 0, 1]))
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.to_dict(), {"y": 0, "z": 1})
+        self.assertNotIn("x", table)
+        self.assertIsNone(table.get("x"))
+        self.assertEqual(table.remap_values(np.array([5, -1])).to_dict(), {"y": 5})
+
+    def test_pickle(self):
+        mapping = {"x": 1, "y": 2}
+        table = pickle.loads(pickle.dumps(build_string_table(mapping)))
+        self.assertEqual(table.to_dict(), mapping)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -55,5 +55,49 @@ class TextFuncsTest(unittest.TestCase):
         self.assertTrue(includes_any_of_texts(lines, texts))
 
 
+    def test_text_conditions(self):
+        lines = ["a b", "c", "d e", "", "abc", "b"]
+        windows = [(b, e) for b in range(len(lines) + 1) for e in range(b, len(lines) + 1)]
+        for include, exclude in [
+            (["a"], []),
+            (["b", "c"], []),
+            ([], ["d"]),
+            (["b"], ["c", "x"]),
+            (["ab", "a", "bc"], []),  # overlapping texts
+            (["b e"], []),
+            (["c\nd"], []),  # across lines
+            ([""], ["e"]),
+            (["x"], []),
+        ]:
+            conds = TextConditions(include, exclude)
+            expected = [
+                pos
+                for pos in windows
+                if not (
+                    include
+                    and not includes_all_texts(lines[pos[0] : pos[1]], include)
+                    or exclude
+                    and includes_any_of_texts(lines[pos[0] : pos[1]], exclude)
+                )
+            ]
+            self.assertEqual(conds.windows_satisfying(lines, windows), expected, (include, exclude))
+            self.assertEqual(
+                conds.satisfied(lines, windows).tolist(), [pos in expected for pos in windows], (include, exclude)
+            )
+
+    def test_text_conditions_lines_containing(self):
+        conds = TextConditions(["ab", "b"], ["a"])
+        actual = conds.lines_containing(["xab", "b", "", "aab b"])
+        self.assertEqual(
+            actual.tolist(),
+            [
+                [True, False, False, True],
+                [True, True, False, True],
+                [True, False, False, True],
+            ],
+        )
+        self.assertFalse(TextConditions([], []))
+
+
 if __name__ == "__main__":
     unittest.main()
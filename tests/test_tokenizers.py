@@ -0,0 +1,88 @@
+from typing import *
+
+import importlib.util
+import unittest
+
+import nltk
+
+from dvg.tokenizers import *
+
+
+EN_LINES = [
+    "",
+    "   ",
+    "hello world",
+    "  Hello   World  ",
+    "Hello, world.",
+    "He said, \"I can't do that.\" Then he left!",
+    "Is this the end? No! It is (not) the end...",
+    "the price is $3.50 per item; 20% off",
+    "e-mail: someone@example.com, #tag & more",
+    "I cannot, I gotta go, wanna come",
+    "Gimme that; lemme see, you gonna tell me",
+    "it's 'quoted' and ``double'' quoted -- also",
+    "Mr. Smith went to Washington. He arrived at 5 p.m.",
+    "a:b c: d, e,f 1,000 2:30",
+    "[brackets] {braces} <angles> (parens)",
+    "“curly quotes” and ‘single’ ones… with dashes — like this",
+    "unicode café naïve résumé",
+    "trailing quote ending with a dash-'s' \n",
+    "tabs\tand\nnewlines\nin a window",
+    "they'll we'd I'm you're isn't 'tis d'ye more'n",
+    "under_score snake_case_words 42nd",
+]
+
+
+def punkt_available() -> bool:
+    try:
+        nltk.word_tokenize("hello, world.")
+        return True
+    except LookupError:
+        return False
+
+
+def module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+class EnTokenizerTest(unittest.TestCase):
+    def test_conformance_without_sentence_split(self):
+        # a text without sentence-end characters is a single sentence, so punkt can be skipped in the reference
+        tokenize = make_en_tokenizer()
+        for L in EN_LINES:
+            if any(c in L for c in ".?!"):
+                continue  # for L
+            self.assertEqual(tokenize(L), nltk.word_tokenize(L.rstrip(), preserve_line=True), repr(L))
+
+    @unittest.skipUnless(punkt_available(), "punkt data is not installed")
+    def test_conformance(self):
+        tokenize = make_en_tokenizer()
+        for L in EN_LINES:
+            self.assertEqual(tokenize(L), nltk.word_tokenize(L), repr(L))
+
+
+JA_LINES = [
+    "",
+    "吾輩は猫である。名前はまだ無い。",
+    "ＡＢＣの全角英数字１２３と半角ｶﾀｶﾅ",
+    "Pythonで書かれたDocument Vector Grep",
+    "今日は\n良い天気です",
+]
+
+
+@unittest.skipUnless(
+    module_available("fugashi") and module_available("ipadic") and module_available("transformers"),
+    "fugashi, ipadic, or transformers is not installed",
+)
+class JaTokenizerTest(unittest.TestCase):
+    def test_conformance(self):
+        import transformers
+
+        ref = transformers.MecabTokenizer(do_lower_case=True)
+        tokenize = make_ja_tokenizer()
+        for L in JA_LINES:
+            self.assertEqual(tokenize(L), ref.tokenize(L), repr(L))
+
+
+if __name__ == "__main__":
+    unittest.main()